@@ -2,13 +2,16 @@
 
 import logging
 import re
+import shutil
 from pathlib import Path
 from typing import Optional, Tuple
 
+from sqlalchemy import func, select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.config import get_settings
 from app.files.storage import user_base_path
+from app.users.models import User
 
 log = logging.getLogger(__name__)
 
@@ -70,7 +73,6 @@ def get_drive_stats(path: Path) -> Tuple[int, int]:
     Return (total_bytes, free_bytes) for the filesystem containing path.
     Uses shutil.disk_usage (cross-platform); falls back to os.statvfs on Unix if needed.
     """
-    import shutil
     try:
         usage = shutil.disk_usage(path.resolve())
         return (usage.total, usage.free)
@@ -106,15 +108,12 @@ def get_server_storage_limit_bytes() -> Optional[int]:
 
 async def get_user_used_bytes(session: AsyncSession, email: str) -> int:
     """Return bytes used by the given user (from database cache)."""
-    from app.users.models import User
     user = await session.get(User, email)
     return user.storage_used_bytes if user else 0
 
 
 async def get_total_used_bytes(session: AsyncSession) -> int:
     """Return total bytes used by all users (from database)."""
-    from app.users.models import User
-    from sqlalchemy import func, select
     result = await session.execute(select(func.sum(User.storage_used_bytes)))
     return result.scalar() or 0
 
@@ -6,11 +6,12 @@ import os
 import shutil
 import tempfile
 import uuid
+import zlib
 from pathlib import Path
-from typing import Annotated, List, Optional
+from typing import Annotated, AsyncIterator, List, Optional
 
 from fastapi import APIRouter, Depends, HTTPException, Request, status
-from fastapi.responses import FileResponse, StreamingResponse
+from fastapi.responses import FileResponse, Response, StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.auth.dependencies import get_current_user
@@ -43,12 +44,77 @@ from app.users.models import User
 router = APIRouter(prefix="/api/files", tags=["files"])
 log = logging.getLogger(__name__)
 
+# Request body encodings accepted by POST /upload (advertised via /api/meta/version).
+UPLOAD_CONTENT_ENCODINGS = ("gzip",)
+# Upper bound on bytes produced per decompression step (keeps gzip bombs bounded by quota checks).
+_UPLOAD_DECODE_CHUNK = 1024 * 1024
+
+
+def _list_etag(email: str, rows: List[dict]) -> str:
+    """Strong ETag for a user's file list: changes with any path, mtime, size or hash.
+
+    The user is part of the digest so one account's tag never validates another's list.
+    """
+    h = hashlib.sha256(email.encode())
+    for r in sorted(rows, key=lambda r: r["path"]):
+        h.update(f"\0{r['path']}\0{r['mtime']!r}\0{r.get('size')}\0{r.get('hash') or ''}".encode())
+    return f'"{h.hexdigest()[:32]}"'
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """True if an ``If-None-Match`` header value lists ``etag`` (weak comparison)."""
+    if not if_none_match:
+        return False
+    tags = (t.strip() for t in if_none_match.split(","))
+    return any(t == "*" or t.removeprefix("W/") == etag for t in tags)
+
 
 def _normalize_path_param(path: Optional[str]) -> str:
     """Return path from query string. Do not replace + with space: filenames may contain +."""
     return path or ""
 
 
+async def _decoded_body(request: Request, encoding: str) -> AsyncIterator[bytes]:
+    """Yield the upload body, gunzipping on the fly when ``Content-Encoding: gzip``.
+
+    Output is produced in steps of at most ``_UPLOAD_DECODE_CHUNK`` bytes so quota and
+    size checks see decompressed sizes before a highly compressible body is expanded.
+    Concatenated gzip members (RFC 1952, as written by pigz or bgzip) are decoded in
+    turn; trailing bytes that are not a gzip member are rejected.
+    """
+    if encoding != "gzip":
+        async for chunk in request.stream():
+            yield chunk
+        return
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    try:
+        async for chunk in request.stream():
+            data = chunk
+            while data:
+                out = decompressor.decompress(data, _UPLOAD_DECODE_CHUNK)
+                if out:
+                    yield out
+                if decompressor.eof and decompressor.unused_data:
+                    # Member ended mid-chunk: the rest starts the next member.
+                    data = decompressor.unused_data
+                    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+                else:
+                    data = decompressor.unconsumed_tail
+        tail = decompressor.flush()
+    except zlib.error as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid gzip upload body: {e}",
+        )
+    if tail:
+        yield tail
+    if not decompressor.eof:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Truncated gzip upload body",
+        )
+
+
 @router.get("/storage")
 @limiter.limit("60/minute")
 async def get_storage(
@@ -96,14 +162,18 @@ async def get_storage(
 @limiter.limit("60/minute")
 async def list_files(
     request: Request,
+    response: Response,
     current_user: Annotated[User, Depends(get_current_user)],
     session: Annotated[AsyncSession, Depends(get_db)],
-) -> List[dict]:
+):
     """List all files for the current user (recursive, ``path`` + ``mtime`` + ``size`` + optional ``hash``).
 
     The ``size`` field was added in API 0.3.0 and is sent as bytes (int).
     Older clients ignore unknown fields, so the response stays backward
     compatible.
+
+    The response carries an ``ETag``; a request whose ``If-None-Match`` lists the
+    current tag gets an empty **304** so unchanged lists are not resent and re-parsed.
     """
     base = user_base_path(current_user.email)
     base.mkdir(parents=True, exist_ok=True)
@@ -113,6 +183,11 @@ async def list_files(
     for r in result:
         if r["path"] in hashes:
             r["hash"] = hashes[r["path"]]
+    etag = _list_etag(current_user.email, result)
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        log.info("list_files user=%s count=%d not modified", current_user.email, len(result))
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+    response.headers["ETag"] = etag
     log.info("list_files user=%s count=%d", current_user.email, len(result))
     return result
 
@@ -343,6 +418,10 @@ async def upload_file(
     """
     Upload a file by streaming the request body directly to a temporary file.
     Enforces quota during streaming to fail fast.
+
+    The body may be sent with ``Content-Encoding: gzip``; it is decoded while streaming, so
+    size, quota and content hash all refer to the stored (decompressed) file. Clients should
+    check ``upload_content_encodings`` in /api/meta/version rather than ``api_version``.
     """
     path_param = _normalize_path_param(request.query_params.get("path"))
     if not path_param or not path_param.strip():
@@ -350,6 +429,14 @@ async def upload_file(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Query parameter 'path' is required",
         )
+    encoding = request.headers.get("content-encoding", "").strip().lower()
+    if encoding in ("", "identity"):
+        encoding = ""
+    elif encoding not in UPLOAD_CONTENT_ENCODINGS:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail=f"Unsupported Content-Encoding: {encoding}",
+        )
     try:
         target = resolve_user_path(current_user.email, path_param)
     except ValueError as e:
@@ -385,7 +472,7 @@ async def upload_file(
     fd, temp_path = tempfile.mkstemp(dir=temp_dir, prefix=".bb_upload_")
     try:
         with os.fdopen(fd, "wb") as f:
-            async for chunk in request.stream():
+            async for chunk in _decoded_body(request, encoding):
                 if not chunk:
                     continue
 
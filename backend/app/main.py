@@ -2,6 +2,7 @@
 
 import logging
 from contextlib import asynccontextmanager
+from logging.handlers import MemoryHandler
 from pathlib import Path
 
 from fastapi import FastAPI, HTTPException, Request
@@ -23,6 +24,9 @@ from app.users.service import ensure_admin_exists
 
 log = logging.getLogger(__name__)
 
+# Records buffered before the log file is written (see _setup_logging).
+_LOG_FILE_BUFFER_RECORDS = 64
+
 
 def _setup_logging() -> None:
     """Configure logging from settings (stderr always; optional file)."""
@@ -44,7 +48,11 @@ def _setup_logging() -> None:
             fh = logging.FileHandler(settings.log_file, encoding="utf-8")
             fh.setLevel(level)
             fh.setFormatter(fmt)
-            root.addHandler(fh)
+            # Batch DEBUG/INFO records (one per file request) into fewer writes; WARNING and
+            # above flush immediately. logging.shutdown() flushes the rest on exit.
+            mh = MemoryHandler(_LOG_FILE_BUFFER_RECORDS, flushLevel=logging.WARNING, target=fh)
+            mh.setLevel(level)
+            root.addHandler(mh)
             root.info("Logging to file %s", settings.log_file)
         except OSError as e:
             root.warning("Could not open log file %s: %s", settings.log_file, e)
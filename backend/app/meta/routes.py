@@ -1,9 +1,12 @@
 """Public API metadata."""
 
+from typing import List
+
 from fastapi import APIRouter
 from pydantic import BaseModel
 
 from app.config import get_settings
+from app.files.routes import UPLOAD_CONTENT_ENCODINGS
 from app.limiter import limiter
 
 router = APIRouter(prefix="/api/meta", tags=["meta"])
@@ -16,6 +19,8 @@ class VersionResponse(BaseModel):
     min_supported_client_version: str
     # True when Google OAuth env is set; UI should hide "Sign in with Google" when False.
     google_signin_available: bool
+    # Content-Encoding values accepted on POST /api/files/upload (clients may compress bodies).
+    upload_content_encodings: List[str]
 
 
 @router.get("/version", response_model=VersionResponse)
@@ -30,4 +35,5 @@ def api_version() -> VersionResponse:
         api_version=s.api_version,
         min_supported_client_version=s.min_supported_client_version,
         google_signin_available=google_ok,
+        upload_content_encodings=list(UPLOAD_CONTENT_ENCODINGS),
     )
@@ -7,6 +7,7 @@ import secrets
 import uuid
 from datetime import datetime, timedelta, timezone
 from typing import Annotated
+from urllib.parse import urlencode
 
 from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
 from fastapi.responses import RedirectResponse
@@ -61,8 +62,6 @@ async def google_oauth_start(
     session.add(OAuthState(state=state))
     await session.commit()
     redirect_uri = _google_redirect_uri(settings, request)
-    from urllib.parse import urlencode
-
     q = urlencode(
         {
             "client_id": settings.google_client_id,
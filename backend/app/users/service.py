@@ -129,8 +129,7 @@ async def ensure_admin_exists(session: AsyncSession) -> None:
             await session.commit()
         return
     log.info("Creating bootstrap admin user email=%s", settings.admin_email)
-    from app.users.models import UserCreate as UC
-    payload = UC(
+    payload = UserCreate(
         email=settings.admin_email,
         first_name="Admin",
         last_name="User",
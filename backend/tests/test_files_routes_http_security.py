@@ -159,6 +159,27 @@ def test_list_files_returns_size(client: TestClient) -> None:
     assert rows["sized.bin"]["size"] == len(body)
 
 
+def test_list_files_etag_returns_304_until_list_changes(client: TestClient) -> None:
+    """/list sends an ETag; If-None-Match with it gets 304 until a file changes."""
+    headers = _bearer(client)
+    assert client.post("/api/files/upload?path=a.txt", content=b"a", headers=headers).status_code == 200
+
+    r = client.get("/api/files/list", headers=headers)
+    assert r.status_code == 200
+    etag = r.headers["etag"]
+
+    same = client.get("/api/files/list", headers={**headers, "If-None-Match": etag})
+    assert same.status_code == 304
+    assert same.content == b""
+    assert same.headers["etag"] == etag
+
+    assert client.post("/api/files/upload?path=b.txt", content=b"b", headers=headers).status_code == 200
+    changed = client.get("/api/files/list", headers={**headers, "If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["etag"] != etag
+    assert {row["path"] for row in changed.json()} == {"a.txt", "b.txt"}
+
+
 # --- /api/files/mkdir -------------------------------------------------------
 
 
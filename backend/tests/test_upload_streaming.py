@@ -1,3 +1,5 @@
+import gzip
+import hashlib
 import pytest
 from fastapi.testclient import TestClient
 from app.main import app
@@ -45,6 +47,21 @@ async def setup_storage(tmp_path, monkeypatch, init_test_db, session_factory):
     yield storage_base
     shutil.rmtree(storage_base)
 
+def _set_user_limit(limit_bytes):
+    from app.users.models import User
+    from sqlalchemy import update
+    async def set_limit():
+        from app.db.session import get_session
+        async with get_session() as session:
+            await session.execute(
+                update(User)
+                .where(User.email == "test@example.com")
+                .values(storage_limit_bytes=limit_bytes)
+            )
+            await session.commit()
+    import asyncio
+    asyncio.run(set_limit())
+
 def test_upload_streaming_success(auth_headers):
     content = b"streaming content" * 100
     response = client.post(
@@ -65,20 +82,7 @@ def test_upload_streaming_quota_exceeded(auth_headers, monkeypatch):
     monkeypatch.setenv("BRANDYBOX_STORAGE_LIMIT", "100MB")
 
     # Mock user quota to be very small
-    from app.users.models import User
-    from sqlalchemy import update
-    async def set_limit():
-        from app.db.session import get_session
-        async with get_session() as session:
-            await session.execute(
-                update(User)
-                .where(User.email == "test@example.com")
-                .values(storage_limit_bytes=50)
-            )
-            await session.commit()
-
-    import asyncio
-    asyncio.run(set_limit())
+    _set_user_limit(50)
 
     content = b"a" * 101
     response = client.post(
@@ -95,19 +99,7 @@ def test_upload_streaming_quota_exceeded(auth_headers, monkeypatch):
 
 def test_upload_streaming_large_file(auth_headers):
     # Ensure user has large enough limit
-    from app.users.models import User
-    from sqlalchemy import update
-    async def set_limit():
-        from app.db.session import get_session
-        async with get_session() as session:
-            await session.execute(
-                update(User)
-                .where(User.email == "test@example.com")
-                .values(storage_limit_bytes=10*1024*1024)
-            )
-            await session.commit()
-    import asyncio
-    asyncio.run(set_limit())
+    _set_user_limit(10*1024*1024)
 
     # Test with 1MB file (not huge but enough to test streaming logic)
     content = b"large" * 200000
@@ -122,3 +114,58 @@ def test_upload_streaming_large_file(auth_headers):
     target = user_base_path("test@example.com") / "large.txt"
     assert target.exists()
     assert target.stat().st_size == len(content)
+
+def test_upload_gzip_encoded_body_is_stored_decompressed(auth_headers):
+    _set_user_limit(10*1024*1024)
+
+    content = b'{"key": "value"}\n' * 4000
+    response = client.post(
+        "/api/files/upload?path=export.json",
+        content=gzip.compress(content),
+        headers={**auth_headers, "Content-Encoding": "gzip"},
+    )
+    assert response.status_code == 200, response.text
+    assert response.json()["size"] == len(content)
+    assert response.json()["hash"] == hashlib.sha256(content).hexdigest()
+
+    target = user_base_path("test@example.com") / "export.json"
+    assert target.read_bytes() == content
+
+def test_upload_rejects_unsupported_or_corrupt_encoding(auth_headers):
+    _set_user_limit(10*1024*1024)
+
+    response = client.post(
+        "/api/files/upload?path=x.bin",
+        content=b"data",
+        headers={**auth_headers, "Content-Encoding": "br"},
+    )
+    assert response.status_code == 415
+
+    response = client.post(
+        "/api/files/upload?path=x.bin",
+        content=b"not gzip at all",
+        headers={**auth_headers, "Content-Encoding": "gzip"},
+    )
+    assert response.status_code == 400
+    assert not (user_base_path("test@example.com") / "x.bin").exists()
+
+def test_upload_gzip_multi_member_body_is_decoded_in_full(auth_headers):
+    _set_user_limit(10*1024*1024)
+
+    response = client.post(
+        "/api/files/upload?path=members.txt",
+        content=gzip.compress(b"hello ") + gzip.compress(b"world"),
+        headers={**auth_headers, "Content-Encoding": "gzip"},
+    )
+    assert response.status_code == 200, response.text
+    assert response.json()["size"] == len(b"hello world")
+    target = user_base_path("test@example.com") / "members.txt"
+    assert target.read_bytes() == b"hello world"
+
+    response = client.post(
+        "/api/files/upload?path=trailing.txt",
+        content=gzip.compress(b"hello ") + b"trailing garbage",
+        headers={**auth_headers, "Content-Encoding": "gzip"},
+    )
+    assert response.status_code == 400
+    assert not (user_base_path("test@example.com") / "trailing.txt").exists()
@@ -33,6 +33,7 @@ def test_meta_version(client: TestClient) -> None:
     assert "api_version" in j
     assert "min_supported_client_version" in j
     assert j.get("google_signin_available") is False
+    assert "gzip" in j["upload_content_encodings"]
 
 
 def test_preferences_roundtrip(client: TestClient) -> None:
@@ -1,39 +1,294 @@
 //! HTTP client for Brandy Box backend API. Matches Python client endpoints and behavior.
 
+use flate2::read::GzEncoder;
+use flate2::Compression;
 use serde::{Deserialize, Serialize};
+use sha2::{Digest, Sha256};
 use std::fs::File;
 use std::path::Path;
-use std::time::Duration;
+use std::sync::atomic::{AtomicBool, AtomicU64, Ordering};
+use std::sync::{Arc, Condvar, Mutex, OnceLock};
+use std::time::{Duration, Instant};
+
+/// Upload timeout = base + safety factor * size / estimated throughput (bytes/s).
+const UPLOAD_TIMEOUT_BASE_SECS: f64 = 30.0;
+const UPLOAD_TIMEOUT_FACTOR: f64 = 3.0;
+/// Estimate before the first upload completes: no throughput measured yet.
+const UPLOAD_BPS_UNMEASURED: f64 = 0.0;
+/// Floor used for timeouts once throughput has been measured.
+const UPLOAD_BPS_FLOOR: f64 = 128_000.0;
+/// Size-based timeout used until a throughput sample exists: 600 s + 30 s per MB,
+/// counting at most 100 MB, so a large first upload on a slow link is not cut short.
+const UPLOAD_TIMEOUT_UNMEASURED_BASE_SECS: u64 = 600;
+const UPLOAD_TIMEOUT_UNMEASURED_SECS_PER_MB: u64 = 30;
+const UPLOAD_TIMEOUT_UNMEASURED_MAX_MB: u64 = 100;
+/// EWMA weight of the newest throughput sample.
+const UPLOAD_BPS_ALPHA: f64 = 0.2;
+
+/// Bounds applied to a server-provided Retry-After delay.
+const RETRY_AFTER_MIN_SECS: u64 = 1;
+const RETRY_AFTER_MAX_SECS: u64 = 120;
+
+/// Parse a Retry-After header value: delta-seconds or an HTTP-date (RFC 7231).
+/// Returns None when the value is not understood; otherwise clamped to 1..=120 seconds.
+fn parse_retry_after(value: &str) -> Option<Duration> {
+    let v = value.trim();
+    let secs = match v.parse::<u64>() {
+        Ok(n) => n,
+        Err(_) => {
+            let at = chrono::DateTime::parse_from_rfc2822(v).ok()?;
+            let delta = at.with_timezone(&chrono::Utc) - chrono::Utc::now();
+            delta.num_seconds().max(0) as u64
+        }
+    };
+    Some(Duration::from_secs(secs.clamp(RETRY_AFTER_MIN_SECS, RETRY_AFTER_MAX_SECS)))
+}
+
+/// Stringify a transport error. A failed connect usually means the network changed
+/// (e.g. left the LAN), so drop the cached base-URL decision and re-probe next time.
+fn send_error(e: reqwest::Error) -> String {
+    if e.is_connect() {
+        crate::network::invalidate_base_url_cache();
+    }
+    e.to_string()
+}
+
+/// Server-requested delay before retrying a 429/503 response, if it sent a usable Retry-After.
+fn retry_after(r: &reqwest::blocking::Response) -> Option<Duration> {
+    let status = r.status();
+    if status != reqwest::StatusCode::TOO_MANY_REQUESTS && status != reqwest::StatusCode::SERVICE_UNAVAILABLE {
+        return None;
+    }
+    r.headers()
+        .get(reqwest::header::RETRY_AFTER)
+        .and_then(|v| v.to_str().ok())
+        .and_then(parse_retry_after)
+}
+
+/// Upper and lower bounds of the adaptive transfer concurrency limit (see TransferGate).
+const TRANSFER_LIMIT_MAX: f64 = 8.0;
+const TRANSFER_LIMIT_MIN: f64 = 1.0;
+
+/// AIMD limit on concurrent transfer requests (downloads and upload bodies) across all
+/// sync workers. Each 2xx grows the limit by 1/limit, about +1 per round of requests;
+/// a 429/5xx or timeout halves it; anything else leaves it alone (see GateSignal).
+/// Callers beyond the limit wait for a free slot, so the worker count becomes an upper
+/// bound and pressure on a struggling server backs off.
+struct TransferGate {
+    state: Mutex<GateState>,
+    freed: Condvar,
+}
+
+struct GateState {
+    limit: f64,
+    in_flight: usize,
+}
+
+/// What a finished transfer request tells the TransferGate.
+#[derive(Clone, Copy, Debug, PartialEq)]
+enum GateSignal {
+    /// 2xx with the body fully transferred.
+    Grow,
+    /// The server is overloaded or rate limiting: 429, 5xx, or a timeout.
+    Backoff,
+    /// Says nothing about server load: other 4xx, 507 (quota), cancellation, connect errors.
+    Hold,
+}
+
+/// Gate signal for a response status. 507 is a storage quota answer, not load.
+fn status_signal(status: reqwest::StatusCode) -> GateSignal {
+    if status.is_success() {
+        GateSignal::Grow
+    } else if status == reqwest::StatusCode::TOO_MANY_REQUESTS
+        || (status.is_server_error() && status != reqwest::StatusCode::INSUFFICIENT_STORAGE)
+    {
+        GateSignal::Backoff
+    } else {
+        GateSignal::Hold
+    }
+}
+
+/// Gate signal for a failed send or body transfer: only a timeout indicates load.
+fn error_signal(e: &reqwest::Error) -> GateSignal {
+    if e.is_timeout() {
+        GateSignal::Backoff
+    } else {
+        GateSignal::Hold
+    }
+}
+
+/// Slot held for the duration of one transfer request; released on drop.
+struct TransferPermit<'a>(&'a TransferGate);
+
+static TRANSFER_GATE: TransferGate = TransferGate::new(TRANSFER_LIMIT_MAX);
+
+impl TransferGate {
+    const fn new(limit: f64) -> Self {
+        TransferGate { state: Mutex::new(GateState { limit, in_flight: 0 }), freed: Condvar::new() }
+    }
+
+    fn lock(&self) -> std::sync::MutexGuard<'_, GateState> {
+        self.state.lock().unwrap_or_else(|e| e.into_inner())
+    }
+
+    fn acquire(&self) -> TransferPermit<'_> {
+        let mut s = self.lock();
+        while s.in_flight as f64 >= s.limit.floor() {
+            s = self.freed.wait(s).unwrap_or_else(|e| e.into_inner());
+        }
+        s.in_flight += 1;
+        TransferPermit(self)
+    }
+
+    /// Feed back the outcome of a transfer request.
+    fn record(&self, signal: GateSignal) {
+        let mut s = self.lock();
+        s.limit = match signal {
+            GateSignal::Grow => (s.limit + 1.0 / s.limit).min(TRANSFER_LIMIT_MAX),
+            GateSignal::Backoff => (s.limit / 2.0).max(TRANSFER_LIMIT_MIN),
+            GateSignal::Hold => return,
+        };
+        self.freed.notify_all();
+    }
+}
+
+impl Drop for TransferPermit<'_> {
+    fn drop(&mut self) {
+        self.0.lock().in_flight -= 1;
+        self.0.freed.notify_all();
+    }
+}
+
+/// Error returned by transfers aborted through `ApiClient::with_cancel_flag`.
+pub const CANCELLED: &str = "cancelled";
+
+/// How often a retry backoff checks for cancellation.
+const CANCEL_POLL_INTERVAL: Duration = Duration::from_millis(100);
+
+fn cancelled_io_error() -> std::io::Error {
+    std::io::Error::other(CANCELLED)
+}
+
+/// Writer that feeds everything it writes into a SHA-256 hasher and fails once the
+/// transfer is cancelled, which aborts the body copy.
+struct HashingWriter<'a> {
+    inner: &'a mut File,
+    hasher: Sha256,
+    cancel: &'a AtomicBool,
+}
+
+impl std::io::Write for HashingWriter<'_> {
+    fn write(&mut self, buf: &[u8]) -> std::io::Result<usize> {
+        if self.cancel.load(Ordering::Relaxed) {
+            return Err(cancelled_io_error());
+        }
+        let n = self.inner.write(buf)?;
+        self.hasher.update(&buf[..n]);
+        Ok(n)
+    }
+
+    fn flush(&mut self) -> std::io::Result<()> {
+        self.inner.flush()
+    }
+}
+
+/// Upload body reader that fails once the transfer is cancelled, aborting the request.
+struct CancellableReader {
+    inner: File,
+    cancel: Arc<AtomicBool>,
+}
+
+impl std::io::Read for CancellableReader {
+    fn read(&mut self, buf: &mut [u8]) -> std::io::Result<usize> {
+        if self.cancel.load(Ordering::Relaxed) {
+            return Err(cancelled_io_error());
+        }
+        self.inner.read(buf)
+    }
+}
+
+/// Uploads larger than this with a compressible extension are sent gzip-encoded, when the
+/// server lists gzip in `upload_content_encodings`.
+const GZIP_UPLOAD_MIN_BYTES: u64 = 64 * 1024;
+
+/// Extensions of formats that are not already compressed (lowercase).
+const COMPRESSIBLE_EXTENSIONS: &[&str] = &[
+    "txt", "csv", "tsv", "json", "xml", "html", "htm", "css", "js", "ts", "md", "log", "svg",
+    "sql", "yaml", "yml", "toml", "ini", "rtf", "tex", "ps", "eps", "bmp", "tar",
+];
+
+/// Whether an upload of `size` bytes from `local_path` is worth gzip-encoding.
+fn gzip_upload_candidate(local_path: &Path, size: u64) -> bool {
+    size > GZIP_UPLOAD_MIN_BYTES
+        && local_path
+            .extension()
+            .and_then(|e| e.to_str())
+            .is_some_and(|e| COMPRESSIBLE_EXTENSIONS.iter().any(|c| c.eq_ignore_ascii_case(e)))
+}
+
+/// Subset of GET /api/meta/version used by the client.
+#[derive(Deserialize)]
+struct VersionInfo {
+    /// Content-Encoding values accepted on upload; absent on servers that accept none.
+    #[serde(default)]
+    upload_content_encodings: Vec<String>,
+}
+
+/// Base URL and whether that server accepts gzip upload bodies, probed once per process.
+static GZIP_UPLOADS: Mutex<Option<(String, bool)>> = Mutex::new(None);
+
+fn lock_gzip_uploads() -> std::sync::MutexGuard<'static, Option<(String, bool)>> {
+    GZIP_UPLOADS.lock().unwrap_or_else(|e| e.into_inner())
+}
+
+/// Last file list and its ETag, for conditional GET /api/files/list.
+struct ListCache {
+    url: String,
+    etag: String,
+    items: Vec<FileItem>,
+}
+
+static LIST_CACHE: Mutex<Option<ListCache>> = Mutex::new(None);
+
+fn lock_list_cache() -> std::sync::MutexGuard<'static, Option<ListCache>> {
+    LIST_CACHE.lock().unwrap_or_else(|e| e.into_inner())
+}
 
 #[derive(Clone)]
 pub struct ApiClient {
     pub base_url: String,
     pub access_token: Option<String>,
+    /// Accept + Authorization headers, rebuilt only when the token changes.
+    headers: reqwest::header::HeaderMap,
+    /// EWMA of observed upload throughput in bytes/s (f64 bits), shared by clones of this client.
+    upload_bps: Arc<AtomicU64>,
+    /// Once set, transfers stop between body reads/writes and retries; see `with_cancel_flag`.
+    cancel: Arc<AtomicBool>,
 }
 
 #[derive(Serialize)]
-struct LoginBody {
-    email: String,
-    password: String,
+struct LoginBody<'a> {
+    email: &'a str,
+    password: &'a str,
 }
 
 #[derive(Deserialize)]
 pub struct LoginResponse {
     pub access_token: String,
     pub refresh_token: String,
-    #[serde(rename = "expires_in")]
-    pub _expires_in: Option<u64>,
+    /// Access token lifetime in seconds.
+    pub expires_in: Option<u64>,
 }
 
 #[derive(Serialize)]
-struct RefreshBody {
-    refresh_token: String,
+struct RefreshBody<'a> {
+    refresh_token: &'a str,
 }
 
 #[derive(Serialize)]
-struct ChangePasswordBody {
-    current_password: String,
-    new_password: String,
+struct ChangePasswordBody<'a> {
+    current_password: &'a str,
+    new_password: &'a str,
 }
 
 #[derive(Deserialize)]
@@ -60,18 +315,21 @@ pub struct StorageInfo {
     pub server_disk_path: Option<String>,
 }
 
-#[derive(Deserialize)]
+#[derive(Clone, Deserialize)]
 pub struct FileItem {
     pub path: String,
     pub mtime: f64,
+    /// File size in bytes (API 0.3.0+). Lets sync rule out a content match without hashing.
+    #[serde(default)]
+    pub size: Option<u64>,
     pub hash: Option<String>,
 }
 
 #[derive(Serialize)]
-struct CreateUserBody {
-    email: String,
-    first_name: String,
-    last_name: String,
+struct CreateUserBody<'a> {
+    email: &'a str,
+    first_name: &'a str,
+    last_name: &'a str,
 }
 
 #[derive(Serialize)]
@@ -81,51 +339,154 @@ struct UpdateUserBody {
 
 impl ApiClient {
     pub fn new(base_url: String) -> Self {
-        ApiClient { base_url, access_token: None }
+        let base_url = base_url.trim_end_matches('/').to_string();
+        ApiClient {
+            base_url,
+            access_token: None,
+            headers: Self::build_headers(None),
+            upload_bps: Arc::new(AtomicU64::new(UPLOAD_BPS_UNMEASURED.to_bits())),
+            cancel: Arc::new(AtomicBool::new(false)),
+        }
+    }
+
+    /// Clone whose downloads and uploads give up with CANCELLED once `cancel` is set,
+    /// mid-body or during a retry backoff, instead of running to completion.
+    pub fn with_cancel_flag(&self, cancel: Arc<AtomicBool>) -> Self {
+        ApiClient { cancel, ..self.clone() }
+    }
+
+    fn check_cancelled(&self) -> Result<(), String> {
+        if self.cancel.load(Ordering::Relaxed) {
+            Err(CANCELLED.to_string())
+        } else {
+            Ok(())
+        }
+    }
+
+    /// Retry backoff that wakes up early (with CANCELLED) when the client is cancelled.
+    fn pause(&self, wait: Duration) -> Result<(), String> {
+        let until = Instant::now() + wait;
+        loop {
+            self.check_cancelled()?;
+            let left = until.saturating_duration_since(Instant::now());
+            if left.is_zero() {
+                return Ok(());
+            }
+            std::thread::sleep(left.min(CANCEL_POLL_INTERVAL));
+        }
+    }
+
+    /// Absolute URL for an API path (base URL is stored without trailing slash).
+    fn url(&self, path: &str) -> String {
+        let mut u = String::with_capacity(self.base_url.len() + path.len());
+        u.push_str(&self.base_url);
+        u.push_str(path);
+        u
     }
 
     pub fn set_access_token(&mut self, token: Option<String>) {
+        self.headers = Self::build_headers(token.as_deref());
         self.access_token = token;
     }
 
-    fn client(&self) -> reqwest::blocking::Client {
-        reqwest::blocking::Client::builder()
-            .timeout(Duration::from_secs(30))
-            .build()
-            .expect("http client")
+    fn build_headers(token: Option<&str>) -> reqwest::header::HeaderMap {
+        let mut h = reqwest::header::HeaderMap::new();
+        h.insert(reqwest::header::ACCEPT, reqwest::header::HeaderValue::from_static("application/json"));
+        if let Some(t) = token {
+            if let Ok(v) = format!("Bearer {}", t).parse() {
+                h.insert(reqwest::header::AUTHORIZATION, v);
+            }
+        }
+        h
+    }
+
+    /// Process-wide API client. Shared by every ApiClient (one is created per Tauri
+    /// command) and by all sync workers, so requests and uploads reuse pooled keep-alive
+    /// connections instead of paying a TCP and TLS handshake each time. Calls that need a
+    /// longer deadline than the default set it per request.
+    fn client(&self) -> &'static reqwest::blocking::Client {
+        static CLIENT: OnceLock<reqwest::blocking::Client> = OnceLock::new();
+        CLIENT.get_or_init(|| {
+            reqwest::blocking::Client::builder()
+                .timeout(Duration::from_secs(30))
+                .tcp_keepalive(Duration::from_secs(60))
+                .pool_idle_timeout(Duration::from_secs(30))
+                .build()
+                .expect("http client")
+        })
     }
 
     /// Client for binary download: long timeout, no gzip/deflate so response body is raw bytes
     /// (avoids "error decoding response body" when server or proxy sends compressed binary).
-    fn download_client(&self) -> reqwest::blocking::Client {
-        reqwest::blocking::Client::builder()
-            .timeout(Duration::from_secs(600))
-            .no_gzip()
-            .no_deflate()
-            .build()
-            .expect("http client")
+    /// Shared like `client()`.
+    fn download_client(&self) -> &'static reqwest::blocking::Client {
+        static CLIENT: OnceLock<reqwest::blocking::Client> = OnceLock::new();
+        CLIENT.get_or_init(|| {
+            reqwest::blocking::Client::builder()
+                .timeout(Duration::from_secs(600))
+                .no_gzip()
+                .no_deflate()
+                .build()
+                .expect("http client")
+        })
     }
 
-    fn headers(&self) -> reqwest::header::HeaderMap {
-        let mut h = reqwest::header::HeaderMap::new();
-        h.insert(reqwest::header::ACCEPT, "application/json".parse().unwrap());
-        if let Some(t) = &self.access_token {
-            let v = format!("Bearer {}", t);
-            h.insert(reqwest::header::AUTHORIZATION, v.parse().unwrap());
+    fn upload_bps(&self) -> f64 {
+        f64::from_bits(self.upload_bps.load(Ordering::Relaxed))
+    }
+
+    /// Timeout for sending `bytes` upstream, derived from the observed upload throughput,
+    /// or from the size alone until the first upload has been measured.
+    fn upload_timeout(&self, bytes: u64) -> Duration {
+        let bps = self.upload_bps();
+        if bps == UPLOAD_BPS_UNMEASURED {
+            let mb = (bytes / (1024 * 1024)).min(UPLOAD_TIMEOUT_UNMEASURED_MAX_MB);
+            return Duration::from_secs(UPLOAD_TIMEOUT_UNMEASURED_BASE_SECS + mb * UPLOAD_TIMEOUT_UNMEASURED_SECS_PER_MB);
         }
-        h
+        let bps = bps.max(UPLOAD_BPS_FLOOR);
+        Duration::from_secs_f64(UPLOAD_TIMEOUT_BASE_SECS + UPLOAD_TIMEOUT_FACTOR * bytes as f64 / bps)
+    }
+
+    /// Fold a completed upload into the throughput estimate.
+    fn record_upload(&self, bytes: u64, elapsed: Duration) {
+        let secs = elapsed.as_secs_f64();
+        if bytes == 0 || secs <= 0.0 {
+            return;
+        }
+        let sample = bytes as f64 / secs;
+        let prev = self.upload_bps();
+        let ewma = if prev == UPLOAD_BPS_UNMEASURED {
+            sample
+        } else {
+            UPLOAD_BPS_ALPHA * sample + (1.0 - UPLOAD_BPS_ALPHA) * prev
+        };
+        self.upload_bps.store(ewma.to_bits(), Ordering::Relaxed);
+    }
+
+    /// An upload timed out: halve the estimate so the retry gets a longer deadline. Before
+    /// any measurement the retry keeps the size-based deadline.
+    fn record_upload_timeout(&self) {
+        if self.upload_bps() == UPLOAD_BPS_UNMEASURED {
+            return;
+        }
+        let halved = (self.upload_bps() / 2.0).max(UPLOAD_BPS_FLOOR);
+        self.upload_bps.store(halved.to_bits(), Ordering::Relaxed);
+    }
+
+    /// Cached Accept/Authorization headers (cheap clone; no per-request formatting or parsing).
+    fn headers(&self) -> reqwest::header::HeaderMap {
+        self.headers.clone()
     }
 
     pub fn login(&self, email: &str, password: &str) -> Result<LoginResponse, String> {
-        let url = format!("{}/api/auth/login", self.base_url.trim_end_matches('/'));
-        let body = LoginBody { email: email.to_string(), password: password.to_string() };
+        let url = self.url("/api/auth/login");
+        let body = LoginBody { email, password };
         let r = self
             .client()
             .post(&url)
             .json(&body)
-            .header("Content-Type", "application/json")
             .send()
-            .map_err(|e| e.to_string())?;
+            .map_err(send_error)?;
         if !r.status().is_success() {
             let status = r.status();
             let text = r.text().unwrap_or_default();
@@ -135,15 +496,14 @@ impl ApiClient {
     }
 
     pub fn refresh(&self, refresh_token: &str) -> Result<LoginResponse, String> {
-        let url = format!("{}/api/auth/refresh", self.base_url.trim_end_matches('/'));
-        let body = RefreshBody { refresh_token: refresh_token.to_string() };
+        let url = self.url("/api/auth/refresh");
+        let body = RefreshBody { refresh_token };
         let r = self
             .client()
             .post(&url)
             .json(&body)
-            .header("Content-Type", "application/json")
             .send()
-            .map_err(|e| e.to_string())?;
+            .map_err(send_error)?;
         if !r.status().is_success() {
             let status = r.status();
             let text = r.text().unwrap_or_default();
@@ -153,8 +513,8 @@ impl ApiClient {
     }
 
     pub fn me(&self) -> Result<User, String> {
-        let url = format!("{}/api/users/me", self.base_url.trim_end_matches('/'));
-        let r = self.client().get(&url).headers(self.headers()).send().map_err(|e| e.to_string())?;
+        let url = self.url("/api/users/me");
+        let r = self.client().get(&url).headers(self.headers()).send().map_err(send_error)?;
         if !r.status().is_success() {
             return Err(format!("{}", r.status()));
         }
@@ -162,16 +522,15 @@ impl ApiClient {
     }
 
     pub fn change_password(&self, current: &str, new_pass: &str) -> Result<(), String> {
-        let url = format!("{}/api/auth/change-password", self.base_url.trim_end_matches('/'));
-        let body = ChangePasswordBody { current_password: current.to_string(), new_password: new_pass.to_string() };
+        let url = self.url("/api/auth/change-password");
+        let body = ChangePasswordBody { current_password: current, new_password: new_pass };
         let r = self
             .client()
             .post(&url)
             .headers(self.headers())
             .json(&body)
-            .header("Content-Type", "application/json")
             .send()
-            .map_err(|e| e.to_string())?;
+            .map_err(send_error)?;
         if !r.status().is_success() {
             return Err(format!("{}", r.status()));
         }
@@ -179,29 +538,70 @@ impl ApiClient {
     }
 
     pub fn get_storage(&self) -> Result<StorageInfo, String> {
-        let url = format!("{}/api/files/storage", self.base_url.trim_end_matches('/'));
-        let r = self.client().get(&url).headers(self.headers()).send().map_err(|e| e.to_string())?;
+        let url = self.url("/api/files/storage");
+        let r = self.client().get(&url).headers(self.headers()).send().map_err(send_error)?;
         if !r.status().is_success() {
             return Err(format!("{}", r.status()));
         }
         r.json().map_err(|e| e.to_string())
     }
 
+    /// List all files. The last list and its ETag are kept per URL; when the server answers
+    /// 304 Not Modified the kept list is returned instead of downloading and parsing it again.
     pub fn list_files(&self) -> Result<Vec<FileItem>, String> {
-        let url = format!("{}/api/files/list", self.base_url.trim_end_matches('/'));
-        let client = reqwest::blocking::Client::builder()
-            .timeout(Duration::from_secs(60))
-            .build()
-            .expect("client");
-        let r = client.get(&url).headers(self.headers()).send().map_err(|e| e.to_string())?;
+        let url = self.url("/api/files/list");
+        let mut req = self.client().get(&url).timeout(Duration::from_secs(60)).headers(self.headers());
+        let cached_etag = lock_list_cache().as_ref().filter(|c| c.url == url).map(|c| c.etag.clone());
+        if let Some(etag) = cached_etag {
+            req = req.header(reqwest::header::IF_NONE_MATCH, etag);
+        }
+        let r = req.send().map_err(send_error)?;
+        if r.status() == reqwest::StatusCode::NOT_MODIFIED {
+            if let Some(c) = lock_list_cache().as_ref().filter(|c| c.url == url) {
+                return Ok(c.items.clone());
+            }
+            return Err(format!("{}", r.status()));
+        }
         if !r.status().is_success() {
             return Err(format!("{}", r.status()));
         }
-        r.json().map_err(|e| e.to_string())
+        let etag = r
+            .headers()
+            .get(reqwest::header::ETAG)
+            .and_then(|v| v.to_str().ok())
+            .map(str::to_string);
+        let items: Vec<FileItem> = r.json().map_err(|e| e.to_string())?;
+        *lock_list_cache() = etag.map(|etag| ListCache { url, etag, items: items.clone() });
+        Ok(items)
+    }
+
+    /// Whether the server accepts `Content-Encoding: gzip` upload bodies. Asked once per base
+    /// URL via the `upload_content_encodings` field of /api/meta/version and cached; a failed
+    /// probe counts as "no" and is retried on the next upload.
+    fn accepts_gzip_uploads(&self) -> bool {
+        if let Some((url, ok)) = lock_gzip_uploads().as_ref() {
+            if *url == self.base_url {
+                return *ok;
+            }
+        }
+        let probed = self
+            .client()
+            .get(self.url("/api/meta/version"))
+            .send()
+            .ok()
+            .filter(|r| r.status().is_success())
+            .and_then(|r| r.json::<VersionInfo>().ok());
+        let Some(info) = probed else {
+            return false;
+        };
+        let ok = info.upload_content_encodings.iter().any(|e| e.eq_ignore_ascii_case("gzip"));
+        *lock_gzip_uploads() = Some((self.base_url.clone(), ok));
+        ok
     }
 
     /// Upload file from disk with retries. For files > 50MB, uses chunked upload to bypass
-    /// proxy body limits (e.g. Cloudflare 100MB).
+    /// proxy body limits (e.g. Cloudflare 100MB). Compressible files over 64 KiB are sent
+    /// gzip-encoded when the server supports it (see `accepts_gzip_uploads`).
     pub fn upload_file_from_path(&self, path: &str, local_path: &Path) -> Result<(), String> {
         let file_size = std::fs::metadata(local_path).map_err(|e| e.to_string())?.len();
 
@@ -209,28 +609,41 @@ impl ApiClient {
             return self.upload_file_chunked(path, local_path, file_size);
         }
 
-        let url = format!("{}/api/files/upload", self.base_url.trim_end_matches('/'));
-        let url = format!("{}?path={}", url, urlencoding::encode(path));
-        let timeout_secs = 600 + (file_size / (1024 * 1024)).min(100) * 30;
-        let client = reqwest::blocking::Client::builder()
-            .timeout(Duration::from_secs(timeout_secs))
-            .tcp_keepalive(Duration::from_secs(60))
-            .build()
-            .expect("http client");
-
+        let url = format!("{}/api/files/upload?path={}", self.base_url, urlencoding::encode(path));
+        let mut gzip = gzip_upload_candidate(local_path, file_size) && self.accepts_gzip_uploads();
         let mut last_err = String::new();
         for attempt in 0..3 {
+            self.check_cancelled()?;
+            let mut wait = None;
             let file = File::open(local_path).map_err(|e| e.to_string())?;
-            let body = reqwest::blocking::Body::sized(file, file_size);
+            let reader = CancellableReader { inner: file, cancel: Arc::clone(&self.cancel) };
             let mut headers = self.headers();
             headers.insert(
                 reqwest::header::CONTENT_TYPE,
-                "application/octet-stream".parse().unwrap(),
+                reqwest::header::HeaderValue::from_static("application/octet-stream"),
             );
-            match client.post(&url).headers(headers).body(body).send() {
+            // Compressed size is unknown up front, so a gzip body is sent chunked.
+            let body = if gzip {
+                headers.insert(reqwest::header::CONTENT_ENCODING, reqwest::header::HeaderValue::from_static("gzip"));
+                reqwest::blocking::Body::new(GzEncoder::new(reader, Compression::fast()))
+            } else {
+                reqwest::blocking::Body::sized(reader, file_size)
+            };
+            let permit = TRANSFER_GATE.acquire();
+            // The wait for a slot can be long after a backoff; don't send once cancelled.
+            self.check_cancelled()?;
+            let started = Instant::now();
+            match self.client().post(&url).timeout(self.upload_timeout(file_size)).headers(headers).body(body).send() {
                 Ok(r) => {
+                    TRANSFER_GATE.record(status_signal(r.status()));
+                    if gzip && r.status() == reqwest::StatusCode::UNSUPPORTED_MEDIA_TYPE {
+                        // Server (or a proxy in front of it) refused the encoding: send plain bytes.
+                        *lock_gzip_uploads() = Some((self.base_url.clone(), false));
+                        gzip = false;
+                    }
                     if !r.status().is_success() {
                         let status = r.status();
+                        wait = retry_after(&r);
                         let body_text = r.text().unwrap_or_default();
                         last_err = if body_text.trim().is_empty() {
                             format!("{}", status)
@@ -238,29 +651,39 @@ impl ApiClient {
                             format!("{}: {}", status, body_text.trim())
                         };
                     } else {
+                        // Bytes on the wire are unknown for a gzip body; file size would overstate throughput.
+                        if !gzip {
+                            self.record_upload(file_size, started.elapsed());
+                        }
                         return Ok(());
                     }
                 }
                 Err(e) => {
-                    last_err = e.to_string();
+                    TRANSFER_GATE.record(error_signal(&e));
+                    if e.is_timeout() {
+                        self.record_upload_timeout();
+                    }
+                    last_err = send_error(e);
                 }
             }
+            drop(permit);
             if attempt < 2 {
-                std::thread::sleep(Duration::from_secs(3 + attempt as u64 * 4));
+                self.pause(wait.unwrap_or(Duration::from_secs(3 + attempt as u64 * 4)))?;
             }
         }
+        self.check_cancelled()?;
         Err(last_err)
     }
 
     fn upload_file_chunked(&self, path: &str, local_path: &Path, file_size: u64) -> Result<(), String> {
-        let base = self.base_url.trim_end_matches('/');
+        let base = self.base_url.as_str();
         let init_url = format!("{}/api/files/upload/init?path={}", base, urlencoding::encode(path));
 
         let resp = self.client()
             .post(&init_url)
             .headers(self.headers())
             .send()
-            .map_err(|e| format!("init failed: {}", e))?;
+            .map_err(|e| format!("init failed: {}", send_error(e)))?;
 
         if !resp.status().is_success() {
             return Err(format!("init failed: {}", resp.status()));
@@ -277,6 +700,7 @@ impl ApiClient {
         let mut offset = 0;
 
         while offset < file_size {
+            self.check_cancelled()?;
             let current_chunk_size = std::cmp::min(chunk_size, file_size - offset);
             let mut buffer = vec![0; current_chunk_size as usize];
             file.seek(SeekFrom::Start(offset)).map_err(|e| e.to_string())?;
@@ -287,19 +711,44 @@ impl ApiClient {
             let mut last_err = String::new();
             let mut success = false;
             for attempt in 0..3 {
+                let mut wait = None;
                 let mut headers = self.headers();
-                headers.insert(reqwest::header::CONTENT_TYPE, "application/octet-stream".parse().unwrap());
+                headers.insert(reqwest::header::CONTENT_TYPE, reqwest::header::HeaderValue::from_static("application/octet-stream"));
 
-                match self.client().post(&chunk_url).headers(headers).body(buffer.clone()).send() {
+                let permit = TRANSFER_GATE.acquire();
+                self.check_cancelled()?;
+                let started = Instant::now();
+                let sent = self
+                    .client()
+                    .post(&chunk_url)
+                    .timeout(self.upload_timeout(current_chunk_size))
+                    .headers(headers)
+                    .body(buffer.clone())
+                    .send();
+                TRANSFER_GATE.record(match &sent {
+                    Ok(r) => status_signal(r.status()),
+                    Err(e) => error_signal(e),
+                });
+                drop(permit);
+                match sent {
                     Ok(r) if r.status().is_success() => {
+                        self.record_upload(current_chunk_size, started.elapsed());
                         success = true;
                         break;
                     }
-                    Ok(r) => last_err = format!("chunk {} failed: {}", index, r.status()),
-                    Err(e) => last_err = format!("chunk {} failed: {}", index, e),
+                    Ok(r) => {
+                        wait = retry_after(&r);
+                        last_err = format!("chunk {} failed: {}", index, r.status());
+                    }
+                    Err(e) => {
+                        if e.is_timeout() {
+                            self.record_upload_timeout();
+                        }
+                        last_err = format!("chunk {} failed: {}", index, send_error(e));
+                    }
                 }
                 if attempt < 2 {
-                    std::thread::sleep(Duration::from_secs(2 * (attempt + 1) as u64));
+                    self.pause(wait.unwrap_or(Duration::from_secs(2 * (attempt + 1) as u64)))?;
                 }
             }
 
@@ -316,7 +765,7 @@ impl ApiClient {
             .post(&finalize_url)
             .headers(self.headers())
             .send()
-            .map_err(|e| format!("finalize failed: {}", e))?;
+            .map_err(|e| format!("finalize failed: {}", send_error(e)))?;
 
         if !resp.status().is_success() {
             return Err(format!("finalize failed: {}", resp.status()));
@@ -328,24 +777,20 @@ impl ApiClient {
     /// Upload in-memory body (used when caller already has bytes). For large files prefer upload_file_from_path.
     #[allow(dead_code)]
     pub fn upload_file(&self, path: &str, body: &[u8]) -> Result<(), String> {
-        let url = format!("{}/api/files/upload", self.base_url.trim_end_matches('/'));
-        let url = format!("{}?path={}", url, urlencoding::encode(path));
-        let timeout_secs = 600 + (body.len() as u64 / (1024 * 1024)).min(1200) * 60;
-        let client = reqwest::blocking::Client::builder()
-            .timeout(Duration::from_secs(timeout_secs))
-            .build()
-            .expect("http client");
+        let url = format!("{}/api/files/upload?path={}", self.base_url, urlencoding::encode(path));
         let mut headers = self.headers();
         headers.insert(
             reqwest::header::CONTENT_TYPE,
-            "application/octet-stream".parse().unwrap(),
+            reqwest::header::HeaderValue::from_static("application/octet-stream"),
         );
-        let r = client
+        let r = self
+            .client()
             .post(&url)
+            .timeout(self.upload_timeout(body.len() as u64))
             .headers(headers)
             .body(body.to_vec())
             .send()
-            .map_err(|e| e.to_string())?;
+            .map_err(send_error)?;
         if !r.status().is_success() {
             let status = r.status();
             let body_text = r.text().unwrap_or_default();
@@ -358,18 +803,26 @@ impl ApiClient {
         Ok(())
     }
 
-    /// Download file with retries, streaming directly to a temporary file to save memory.
-    /// Returns the bytes of the file for compatibility with existing sync logic.
-    pub fn download_file(&self, path: &str) -> Result<Vec<u8>, String> {
-        let base = self.base_url.trim_end_matches('/');
+    /// Download file with retries, streaming the body into `out` while hashing it, so memory
+    /// stays at one buffer regardless of file size. `out` is rewound before each attempt.
+    /// Returns the number of bytes written and their SHA-256 (hex).
+    pub fn download_file_to(&self, path: &str, out: &mut File) -> Result<(u64, String), String> {
+        use std::io::{Seek, SeekFrom};
+        let base = self.base_url.as_str();
         let url = format!("{}/api/files/download?path={}", base, urlencoding::encode(path));
         let mut last_err = String::new();
 
         for attempt in 0..3 {
+            self.check_cancelled()?;
+            let mut wait = None;
+            let permit = TRANSFER_GATE.acquire();
+            self.check_cancelled()?;
             match self.download_client().get(&url).headers(self.headers()).send() {
                 Ok(mut r) => {
                     if !r.status().is_success() {
+                        TRANSFER_GATE.record(status_signal(r.status()));
                         let status = r.status();
+                        wait = retry_after(&r);
                         let resp_body = r.text().unwrap_or_default();
                         last_err = if resp_body.trim().is_empty() {
                             format!("{}", status)
@@ -377,40 +830,40 @@ impl ApiClient {
                             format!("{}: {}", status, resp_body.trim())
                         };
                     } else {
-                        // Create a temporary file to stream the response into
-                        let tmp_file_path = std::env::temp_dir().join(format!("bb_dl_{}", uuid::Uuid::new_v4()));
-                        let mut tmp_file = File::create(&tmp_file_path).map_err(|e| e.to_string())?;
-
-                        if let Err(e) = r.copy_to(&mut tmp_file) {
-                            let _ = std::fs::remove_file(&tmp_file_path);
-                            last_err = format!("failed to read response body: {}", e);
-                        } else {
-                            // Read from temp file into Vec<u8> (still memory-intensive but respects streaming from network)
-                            // In a full refactor, sync.rs should handle the file path directly.
-                            let mut read_buf = Vec::new();
-                            let mut read_file = File::open(&tmp_file_path).map_err(|e| e.to_string())?;
-                            use std::io::Read;
-                            read_file.read_to_end(&mut read_buf).map_err(|e| e.to_string())?;
-                            let _ = std::fs::remove_file(&tmp_file_path);
-                            return Ok(read_buf);
+                        out.set_len(0).map_err(|e| e.to_string())?;
+                        out.seek(SeekFrom::Start(0)).map_err(|e| e.to_string())?;
+                        let mut sink = HashingWriter { inner: &mut *out, hasher: Sha256::new(), cancel: &self.cancel };
+                        // Grow only once the whole body arrived; a cancelled copy says nothing.
+                        match r.copy_to(&mut sink) {
+                            Ok(n) => {
+                                TRANSFER_GATE.record(GateSignal::Grow);
+                                return Ok((n, format!("{:x}", sink.hasher.finalize())));
+                            }
+                            Err(e) => {
+                                TRANSFER_GATE.record(error_signal(&e));
+                                last_err = format!("failed to read response body: {}", e);
+                            }
                         }
                     }
                 }
                 Err(e) => {
-                    last_err = e.to_string();
+                    TRANSFER_GATE.record(error_signal(&e));
+                    last_err = send_error(e);
                 }
             }
+            drop(permit);
             if attempt < 2 {
-                std::thread::sleep(Duration::from_secs(2 * (attempt + 1)));
+                self.pause(wait.unwrap_or(Duration::from_secs(2 * (attempt + 1))))?;
             }
         }
+        self.check_cancelled()?;
         Err(last_err)
     }
 
     pub fn delete_file(&self, path: &str) -> Result<(), String> {
-        let base = self.base_url.trim_end_matches('/');
+        let base = self.base_url.as_str();
         let url = format!("{}/api/files/delete?path={}", base, urlencoding::encode(path));
-        let r = self.client().delete(&url).headers(self.headers()).send().map_err(|e| e.to_string())?;
+        let r = self.client().delete(&url).headers(self.headers()).send().map_err(send_error)?;
         if r.status().as_u16() == 404 {
             return Ok(());
         }
@@ -421,8 +874,8 @@ impl ApiClient {
     }
 
     pub fn list_users(&self) -> Result<Vec<User>, String> {
-        let url = format!("{}/api/users", self.base_url.trim_end_matches('/'));
-        let r = self.client().get(&url).headers(self.headers()).send().map_err(|e| e.to_string())?;
+        let url = self.url("/api/users");
+        let r = self.client().get(&url).headers(self.headers()).send().map_err(send_error)?;
         if !r.status().is_success() {
             return Err(format!("{}", r.status()));
         }
@@ -430,20 +883,15 @@ impl ApiClient {
     }
 
     pub fn create_user(&self, email: &str, first_name: &str, last_name: &str) -> Result<serde_json::Value, String> {
-        let url = format!("{}/api/users", self.base_url.trim_end_matches('/'));
-        let body = CreateUserBody {
-            email: email.to_string(),
-            first_name: first_name.to_string(),
-            last_name: last_name.to_string(),
-        };
+        let url = self.url("/api/users");
+        let body = CreateUserBody { email, first_name, last_name };
         let r = self
             .client()
             .post(&url)
             .headers(self.headers())
             .json(&body)
-            .header("Content-Type", "application/json")
             .send()
-            .map_err(|e| e.to_string())?;
+            .map_err(send_error)?;
         if !r.status().is_success() {
             return Err(format!("{}", r.status()));
         }
@@ -452,16 +900,15 @@ impl ApiClient {
 
     pub fn update_user_storage_limit(&self, email: &str, limit_bytes: Option<i64>) -> Result<serde_json::Value, String> {
         let encoded = urlencoding::encode(email);
-        let url = format!("{}/api/users/{}", self.base_url.trim_end_matches('/'), encoded);
+        let url = format!("{}/api/users/{}", self.base_url, encoded);
         let body = UpdateUserBody { storage_limit_bytes: limit_bytes };
         let r = self
             .client()
             .patch(&url)
             .headers(self.headers())
             .json(&body)
-            .header("Content-Type", "application/json")
             .send()
-            .map_err(|e| e.to_string())?;
+            .map_err(send_error)?;
         if !r.status().is_success() {
             return Err(format!("{}", r.status()));
         }
@@ -470,7 +917,7 @@ impl ApiClient {
 
     /// Report client version and last sync outcome to the server (best-effort).
     pub fn client_ping(&self, last_sync_ok: Option<bool>, last_sync_at_rfc3339: Option<String>) -> Result<(), String> {
-        let url = format!("{}/api/clients/ping", self.base_url.trim_end_matches('/'));
+        let url = self.url("/api/clients/ping");
         let body = serde_json::json!({
             "client_type": "tauri",
             "client_version": env!("CARGO_PKG_VERSION"),
@@ -482,9 +929,8 @@ impl ApiClient {
             .post(&url)
             .headers(self.headers())
             .json(&body)
-            .header("Content-Type", "application/json")
             .send()
-            .map_err(|e| e.to_string())?;
+            .map_err(send_error)?;
         if r.status() == reqwest::StatusCode::NO_CONTENT || r.status().is_success() {
             return Ok(());
         }
@@ -493,11 +939,143 @@ impl ApiClient {
 
     pub fn delete_user(&self, email: &str) -> Result<(), String> {
         let encoded = urlencoding::encode(email);
-        let url = format!("{}/api/users/{}", self.base_url.trim_end_matches('/'), encoded);
-        let r = self.client().delete(&url).headers(self.headers()).send().map_err(|e| e.to_string())?;
+        let url = format!("{}/api/users/{}", self.base_url, encoded);
+        let r = self.client().delete(&url).headers(self.headers()).send().map_err(send_error)?;
         if !r.status().is_success() {
             return Err(format!("{}", r.status()));
         }
         Ok(())
     }
 }
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    #[test]
+    fn parse_retry_after_seconds_and_http_date() {
+        assert_eq!(parse_retry_after("30"), Some(Duration::from_secs(30)));
+        assert_eq!(parse_retry_after(" 0 "), Some(Duration::from_secs(RETRY_AFTER_MIN_SECS)));
+        assert_eq!(parse_retry_after("9999"), Some(Duration::from_secs(RETRY_AFTER_MAX_SECS)));
+        // HTTP-date in the past: retry as soon as allowed
+        assert_eq!(
+            parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT"),
+            Some(Duration::from_secs(RETRY_AFTER_MIN_SECS))
+        );
+        let soon = (chrono::Utc::now() + chrono::Duration::seconds(60)).to_rfc2822();
+        let d = parse_retry_after(&soon).unwrap();
+        assert!(d >= Duration::from_secs(55) && d <= Duration::from_secs(60));
+        assert_eq!(parse_retry_after("soon"), None);
+    }
+
+    #[test]
+    fn upload_timeout_follows_throughput_estimate() {
+        let client = ApiClient::new("http://localhost".to_string());
+        // Nothing measured yet: size-based deadline, 600 s + 30 s per MB up to 100 MB.
+        assert_eq!(client.upload_timeout(10 * 1024 * 1024), Duration::from_secs(900));
+        assert_eq!(client.upload_timeout(500 * 1024 * 1024), Duration::from_secs(3600));
+        client.record_upload_timeout();
+        assert_eq!(client.upload_timeout(10 * 1024 * 1024), Duration::from_secs(900));
+        // The first sample is taken as-is: 10 MB/s -> 30 s base + 3 * 1 s.
+        client.record_upload(10_000_000, Duration::from_secs(1));
+        assert_eq!(client.upload_bps(), 10_000_000.0);
+        assert_eq!(client.upload_timeout(10_000_000), Duration::from_secs(33));
+        for _ in 0..20 {
+            client.record_upload_timeout();
+        }
+        assert_eq!(client.upload_bps(), UPLOAD_BPS_FLOOR);
+        // Clones share the estimate
+        let clone = client.clone();
+        clone.record_upload(1_000_000, Duration::from_secs(1));
+        assert_eq!(client.upload_bps(), clone.upload_bps());
+    }
+
+    #[test]
+    fn gzip_only_for_larger_compressible_files() {
+        assert!(gzip_upload_candidate(Path::new("dir/export.JSON"), 100_000));
+        assert!(!gzip_upload_candidate(Path::new("dir/export.json"), GZIP_UPLOAD_MIN_BYTES));
+        assert!(!gzip_upload_candidate(Path::new("photo.jpg"), 10_000_000));
+        assert!(!gzip_upload_candidate(Path::new("Makefile"), 10_000_000));
+    }
+
+    #[test]
+    fn gzip_upload_support_is_probed_once() {
+        use std::io::{Read, Write};
+        use std::sync::atomic::AtomicUsize;
+        let listener = std::net::TcpListener::bind("127.0.0.1:0").unwrap();
+        let base = format!("http://{}", listener.local_addr().unwrap());
+        let probes = Arc::new(AtomicUsize::new(0));
+        let seen = Arc::clone(&probes);
+        std::thread::spawn(move || {
+            for mut conn in listener.incoming().flatten() {
+                let mut buf = [0u8; 4096];
+                let _ = conn.read(&mut buf);
+                seen.fetch_add(1, Ordering::SeqCst);
+                let body = r#"{"api_version":"0.3.0","upload_content_encodings":["gzip"]}"#;
+                let _ = write!(
+                    conn,
+                    "HTTP/1.1 200 OK\r\nContent-Type: application/json\r\nContent-Length: {}\r\nConnection: close\r\n\r\n{}",
+                    body.len(),
+                    body
+                );
+            }
+        });
+        let client = ApiClient::new(base);
+        assert!(client.accepts_gzip_uploads());
+        assert!(client.clone().accepts_gzip_uploads());
+        assert_eq!(probes.load(Ordering::SeqCst), 1);
+    }
+
+    #[test]
+    fn cancelled_client_stops_waiting_for_a_retry() {
+        let cancel = Arc::new(AtomicBool::new(false));
+        let original = ApiClient::new("http://localhost".to_string());
+        let client = original.with_cancel_flag(Arc::clone(&cancel));
+        assert_eq!(client.pause(Duration::from_millis(1)), Ok(()));
+        cancel.store(true, Ordering::Relaxed);
+        let started = Instant::now();
+        assert_eq!(client.pause(Duration::from_secs(60)), Err(CANCELLED.to_string()));
+        assert!(started.elapsed() < Duration::from_secs(1));
+        // The client it was derived from is unaffected; clones of the cancelled one are not.
+        assert_eq!(original.check_cancelled(), Ok(()));
+        assert_eq!(client.clone().check_cancelled(), Err(CANCELLED.to_string()));
+    }
+
+    #[test]
+    fn transfer_gate_halves_on_pushback_and_grows_back() {
+        let gate = TransferGate::new(TRANSFER_LIMIT_MAX);
+        gate.record(GateSignal::Backoff);
+        gate.record(GateSignal::Backoff);
+        assert_eq!(gate.lock().limit, 2.0);
+        gate.record(GateSignal::Hold);
+        assert_eq!(gate.lock().limit, 2.0);
+        let (a, b) = (gate.acquire(), gate.acquire());
+        assert_eq!(gate.lock().in_flight, 2);
+        drop((a, b));
+        for _ in 0..10 {
+            gate.record(GateSignal::Backoff);
+        }
+        assert_eq!(gate.lock().limit, TRANSFER_LIMIT_MIN);
+        // Roughly +1 per `limit` successes, capped at the maximum.
+        for _ in 0..5 {
+            gate.record(GateSignal::Grow);
+        }
+        assert!(gate.lock().limit >= 3.0);
+        for _ in 0..100 {
+            gate.record(GateSignal::Grow);
+        }
+        assert_eq!(gate.lock().limit, TRANSFER_LIMIT_MAX);
+        assert_eq!(gate.lock().in_flight, 0);
+    }
+
+    #[test]
+    fn only_2xx_grows_and_only_load_signals_back_off() {
+        use reqwest::StatusCode;
+        assert_eq!(status_signal(StatusCode::OK), GateSignal::Grow);
+        assert_eq!(status_signal(StatusCode::TOO_MANY_REQUESTS), GateSignal::Backoff);
+        assert_eq!(status_signal(StatusCode::SERVICE_UNAVAILABLE), GateSignal::Backoff);
+        assert_eq!(status_signal(StatusCode::NOT_FOUND), GateSignal::Hold);
+        assert_eq!(status_signal(StatusCode::UNAUTHORIZED), GateSignal::Hold);
+        assert_eq!(status_signal(StatusCode::INSUFFICIENT_STORAGE), GateSignal::Hold);
+    }
+}
@@ -2,7 +2,9 @@
 //! Matches Python client paths and config.json layout.
 
 use serde::{Deserialize, Serialize};
-use std::path::PathBuf;
+use std::path::{Path, PathBuf};
+use std::sync::{Mutex, OnceLock};
+use std::time::SystemTime;
 
 #[cfg(windows)]
 use std::os::windows::process::CommandExt;
@@ -23,7 +25,30 @@ fn expand_tilde(path: &str) -> PathBuf {
     PathBuf::from(s)
 }
 
+/// Config directory, resolved once per process. BRANDYBOX_CONFIG_DIR and the
+/// platform variables are set before launch and never change at runtime.
+static CONFIG_DIR: OnceLock<PathBuf> = OnceLock::new();
+
+/// Set once the config directory has been created, so setters skip create_dir_all.
+static CONFIG_DIR_CREATED: OnceLock<()> = OnceLock::new();
+
+/// Whether BRANDYBOX_CONFIG_DIR is set (E2E/CI), read once alongside the config dir.
+static E2E_CONFIG_DIR: OnceLock<bool> = OnceLock::new();
+
 fn config_dir() -> PathBuf {
+    CONFIG_DIR.get_or_init(compute_config_dir).clone()
+}
+
+/// True when the config dir is overridden via BRANDYBOX_CONFIG_DIR (E2E/CI runs).
+pub fn is_e2e_config() -> bool {
+    *E2E_CONFIG_DIR.get_or_init(|| {
+        std::env::var("BRANDYBOX_CONFIG_DIR")
+            .map(|s| !s.trim().is_empty())
+            .unwrap_or(false)
+    })
+}
+
+fn compute_config_dir() -> PathBuf {
     if let Ok(override_dir) = std::env::var("BRANDYBOX_CONFIG_DIR") {
         let s = override_dir.trim();
         if !s.is_empty() {
@@ -59,29 +84,101 @@ struct ConfigFile {
 
 fn ensure_config_dir() -> PathBuf {
     let d = config_dir();
-    let _ = std::fs::create_dir_all(&d);
+    if CONFIG_DIR_CREATED.get().is_none() && std::fs::create_dir_all(&d).is_ok() {
+        let _ = CONFIG_DIR_CREATED.set(());
+    }
     d
 }
 
-fn read_config() -> ConfigFile {
-    let path = config_dir().join(CONFIG_FILENAME);
-    if !path.exists() {
-        return ConfigFile::default();
+/// Parsed config.json together with the (path, mtime, size) it was read from.
+struct CachedConfig {
+    path: PathBuf,
+    mtime: Option<SystemTime>,
+    len: u64,
+    config: ConfigFile,
+}
+
+/// Last parsed config. Getters are called from every Tauri command and tray
+/// callback, so we only re-read the file when its mtime or size changes.
+static CONFIG_CACHE: Mutex<Option<CachedConfig>> = Mutex::new(None);
+
+fn read_config_at(path: &Path) -> ConfigFile {
+    let meta = match std::fs::metadata(path) {
+        Ok(m) => m,
+        Err(_) => return ConfigFile::default(),
+    };
+    let mtime = meta.modified().ok();
+    let len = meta.len();
+    let mut cache = CONFIG_CACHE.lock().unwrap_or_else(|e| e.into_inner());
+    if let Some(c) = cache.as_ref() {
+        if c.path == path && c.mtime.is_some() && c.mtime == mtime && c.len == len {
+            return c.config.clone();
+        }
     }
-    match std::fs::read_to_string(&path) {
-        Ok(s) => serde_json::from_str(&s).unwrap_or_default(),
-        Err(_) => ConfigFile::default(),
+    let config: ConfigFile = match std::fs::read(path) {
+        Ok(bytes) => serde_json::from_slice(&bytes).unwrap_or_default(),
+        Err(_) => return ConfigFile::default(),
+    };
+    *cache = Some(CachedConfig {
+        path: path.to_path_buf(),
+        mtime,
+        len,
+        config: config.clone(),
+    });
+    config
+}
+
+fn read_config() -> ConfigFile {
+    read_config_at(&config_dir().join(CONFIG_FILENAME))
+}
+
+fn invalidate_config_cache() {
+    *CONFIG_CACHE.lock().unwrap_or_else(|e| e.into_inner()) = None;
+}
+
+/// Write `content` to a sibling `<name>.tmp` file and rename it over `path`, so a
+/// crash mid-write never leaves a truncated file behind.
+pub(crate) fn write_atomic(path: &Path, content: &[u8]) -> std::io::Result<()> {
+    replace_file(path, content, false)
+}
+
+/// `write_atomic`, but the temp file is fsynced before the rename so the new content
+/// survives a power loss. Costs a disk flush; meant for the last write of a batch.
+pub(crate) fn write_atomic_durable(path: &Path, content: &[u8]) -> std::io::Result<()> {
+    replace_file(path, content, true)
+}
+
+fn replace_file(path: &Path, content: &[u8], fsync: bool) -> std::io::Result<()> {
+    use std::io::Write;
+    let name = path.file_name().map(|n| n.to_string_lossy()).unwrap_or_default();
+    let tmp = path.with_file_name(format!("{}.tmp", name));
+    let write_tmp = || {
+        let mut file = std::fs::File::create(&tmp)?;
+        file.write_all(content)?;
+        if fsync {
+            file.sync_all()?;
+        }
+        Ok(())
+    };
+    let result = write_tmp().and_then(|_| std::fs::rename(&tmp, path));
+    if result.is_err() {
+        let _ = std::fs::remove_file(&tmp);
     }
+    result
 }
 
+/// Apply all changes in `update` with one read and one write (see `write_atomic`).
 fn write_config(update: impl FnOnce(&mut ConfigFile)) {
     let mut cfg = read_config();
     update(&mut cfg);
     let path = ensure_config_dir().join(CONFIG_FILENAME);
-    let _ = std::fs::write(
-        path,
-        serde_json::to_string_pretty(&cfg).unwrap_or_else(|_| "{}".to_string()),
-    );
+    let content = serde_json::to_vec_pretty(&cfg).unwrap_or_else(|_| b"{}".to_vec());
+    if let Err(e) = write_atomic(&path, &content) {
+        log::warn!("Could not write config {}: {}", path.display(), e);
+    }
+    // A write within the filesystem's mtime granularity may keep the same
+    // (mtime, size), so drop the cache rather than trust the stat key.
+    invalidate_config_cache();
 }
 
 /// Config directory path (for E2E credential file, etc.). Does not create the dir.
@@ -91,19 +188,24 @@ pub fn get_config_dir() -> PathBuf {
 
 #[allow(dead_code)]
 pub fn get_config_path() -> PathBuf {
-    ensure_config_dir();
-    config_dir().join(CONFIG_FILENAME)
+    ensure_config_dir().join(CONFIG_FILENAME)
 }
 
 pub fn get_instance_lock_path() -> PathBuf {
     config_dir().join(INSTANCE_LOCK_FILENAME)
 }
 
+/// Sync state path. Does not create the dir: readers handle a missing file, and
+/// writers go through `get_sync_state_path_ensured`.
 pub fn get_sync_state_path() -> PathBuf {
-    ensure_config_dir();
     config_dir().join(SYNC_STATE_FILENAME)
 }
 
+/// Sync state path with the config dir created (for writers).
+pub fn get_sync_state_path_ensured() -> PathBuf {
+    ensure_config_dir().join(SYNC_STATE_FILENAME)
+}
+
 pub fn get_default_sync_folder() -> PathBuf {
     dirs::home_dir().unwrap_or_else(|| PathBuf::from(".")).join("brandyBox")
 }
@@ -190,6 +292,16 @@ fn apply_autostart_platform(enabled: bool) {
     apply_autostart_linux(enabled, &cmd);
 }
 
+/// Absolute path to Windows PowerShell, so spawning it skips the PATH search (and
+/// cannot pick up a same-named binary earlier on PATH). Falls back to a PATH lookup.
+#[cfg(windows)]
+fn powershell_exe() -> PathBuf {
+    std::env::var_os("SystemRoot")
+        .map(|root| PathBuf::from(root).join(r"System32\WindowsPowerShell\v1.0\powershell.exe"))
+        .filter(|p| p.is_file())
+        .unwrap_or_else(|| PathBuf::from("powershell"))
+}
+
 #[cfg(windows)]
 fn apply_autostart_windows(enabled: bool, cmd: &[String]) {
     let startup = std::env::var("APPDATA").map(|a| PathBuf::from(a).join("Microsoft/Windows/Start Menu/Programs/Startup")).unwrap_or_default();
@@ -207,7 +319,7 @@ fn apply_autostart_windows(enabled: bool, cmd: &[String]) {
             target.replace('"', "`\""),
             args.replace('"', "`\"")
         );
-        let _ = std::process::Command::new("powershell")
+        let _ = std::process::Command::new(powershell_exe())
             .args(["-NoProfile", "-Command", &ps])
             .creation_flags(0x08000000) // CREATE_NO_WINDOW
             .output();
@@ -216,6 +328,16 @@ fn apply_autostart_windows(enabled: bool, cmd: &[String]) {
     }
 }
 
+/// Write the autostart entry only if it differs from what is already on disk, so
+/// re-enabling autostart does not rewrite an identical file.
+#[cfg(unix)]
+fn write_if_changed(path: &Path, content: &str) {
+    if std::fs::read(path).map(|old| old == content.as_bytes()).unwrap_or(false) {
+        return;
+    }
+    let _ = std::fs::write(path, content);
+}
+
 #[cfg(target_os = "macos")]
 fn apply_autostart_macos(enabled: bool, cmd: &[String]) {
     let launch_agents = dirs::home_dir().unwrap_or_else(|| PathBuf::from(".")).join("Library/LaunchAgents");
@@ -241,7 +363,7 @@ fn apply_autostart_macos(enabled: bool, cmd: &[String]) {
 "#,
             args_xml
         );
-        let _ = std::fs::write(plist, content);
+        write_if_changed(&plist, &content);
     } else if plist.exists() {
         let _ = std::fs::remove_file(plist);
     }
@@ -260,7 +382,7 @@ fn apply_autostart_linux(enabled: bool, cmd: &[String]) {
             "[Desktop Entry]\nType=Application\nName=Brandy Box\nExec={}\nX-GNOME-Autostart-enabled=true\n",
             exec
         );
-        let _ = std::fs::write(desktop, content);
+        write_if_changed(&desktop, &content);
     } else if desktop.exists() {
         let _ = std::fs::remove_file(desktop);
     }
@@ -269,5 +391,43 @@ fn apply_autostart_linux(enabled: bool, cmd: &[String]) {
 #[allow(dead_code)]
 pub fn clear_sync_state() {
     let content = r#"{"paths": [], "downloaded_paths": [], "file_hashes": {}}"#;
-    let _ = std::fs::write(get_sync_state_path(), content);
+    let _ = write_atomic(&get_sync_state_path_ensured(), content.as_bytes());
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    #[test]
+    fn read_config_at_reparses_only_when_file_changes() {
+        let dir = std::env::temp_dir().join(format!("bb-config-{}", uuid::Uuid::new_v4()));
+        std::fs::create_dir_all(&dir).unwrap();
+        let path = dir.join(CONFIG_FILENAME);
+        assert!(read_config_at(&path).sync_folder.is_none());
+
+        std::fs::write(&path, r#"{"sync_folder": "/a"}"#).unwrap();
+        assert_eq!(read_config_at(&path).sync_folder.as_deref(), Some("/a"));
+        assert_eq!(read_config_at(&path).sync_folder.as_deref(), Some("/a"));
+
+        std::fs::write(&path, r#"{"sync_folder": "/bb", "autostart": true}"#).unwrap();
+        let cfg = read_config_at(&path);
+        assert_eq!(cfg.sync_folder.as_deref(), Some("/bb"));
+        assert_eq!(cfg.autostart, Some(true));
+        let _ = std::fs::remove_dir_all(&dir);
+    }
+
+    #[test]
+    fn write_atomic_replaces_content_and_leaves_no_temp_file() {
+        let dir = std::env::temp_dir().join(format!("bb-config-{}", uuid::Uuid::new_v4()));
+        std::fs::create_dir_all(&dir).unwrap();
+        let path = dir.join(CONFIG_FILENAME);
+        std::fs::write(&path, b"old content that is longer").unwrap();
+        write_atomic(&path, b"{}").unwrap();
+        assert_eq!(std::fs::read(&path).unwrap(), b"{}");
+        assert!(!dir.join("config.json.tmp").exists());
+        write_atomic_durable(&path, b"[]").unwrap();
+        assert_eq!(std::fs::read(&path).unwrap(), b"[]");
+        assert!(!dir.join("config.json.tmp").exists());
+        let _ = std::fs::remove_dir_all(&dir);
+    }
 }
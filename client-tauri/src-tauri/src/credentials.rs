@@ -11,14 +11,8 @@ const KEY_EMAIL: &str = "email";
 const KEY_REFRESH_TOKEN: &str = "refresh_token";
 const E2E_CREDENTIALS_FILENAME: &str = "e2e_credentials.json";
 
-fn is_e2e_config() -> bool {
-    std::env::var("BRANDYBOX_CONFIG_DIR")
-        .map(|s| !s.trim().is_empty())
-        .unwrap_or(false)
-}
-
 fn service_name() -> &'static str {
-    if is_e2e_config() {
+    if config::is_e2e_config() {
         "BrandyBox-E2E"
     } else {
         SERVICE_NAME
@@ -36,14 +30,11 @@ struct E2ECredentialsFile {
 }
 
 pub fn get_stored() -> Option<(String, String)> {
-    if is_e2e_config() {
-        let path = e2e_credentials_path();
-        if path.exists() {
-            if let Ok(s) = std::fs::read_to_string(&path) {
-                if let Ok(f) = serde_json::from_str::<E2ECredentialsFile>(&s) {
-                    if !f.email.is_empty() && !f.refresh_token.is_empty() {
-                        return Some((f.email, f.refresh_token));
-                    }
+    if config::is_e2e_config() {
+        if let Ok(bytes) = std::fs::read(e2e_credentials_path()) {
+            if let Ok(f) = serde_json::from_slice::<E2ECredentialsFile>(&bytes) {
+                if !f.email.is_empty() && !f.refresh_token.is_empty() {
+                    return Some((f.email, f.refresh_token));
                 }
             }
         }
@@ -59,7 +50,7 @@ pub fn get_stored() -> Option<(String, String)> {
 }
 
 pub fn set_stored(email: &str, refresh_token: &str) {
-    if is_e2e_config() {
+    if config::is_e2e_config() {
         let path = e2e_credentials_path();
         if let Some(parent) = path.parent() {
             let _ = std::fs::create_dir_all(parent);
@@ -76,7 +67,7 @@ pub fn set_stored(email: &str, refresh_token: &str) {
 }
 
 pub fn clear_stored() {
-    if is_e2e_config() {
+    if config::is_e2e_config() {
         let _ = std::fs::remove_file(e2e_credentials_path());
     }
     let service = service_name();
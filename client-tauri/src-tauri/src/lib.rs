@@ -11,15 +11,42 @@ use serde::Serialize;
 use tauri::{Emitter, Manager};
 use std::path::PathBuf;
 use std::sync::Mutex;
-
-#[derive(Default)]
-#[allow(dead_code)]
-struct AppState {
-    /// Cached access token (set after login or refresh). Cleared on logout.
-    access_token: Mutex<Option<String>>,
+use std::time::{Duration, Instant};
+
+/// Access tokens are reused until this long before they expire.
+const ACCESS_TOKEN_REFRESH_MARGIN_SECS: u64 = 120;
+/// Lifetime assumed when the server omits expires_in (backend default: 30 minutes).
+const DEFAULT_ACCESS_TOKEN_TTL_SECS: u64 = 30 * 60;
+/// The background refresher renews this long before the on-demand cutoff, so commands
+/// and syncs find a fresh token instead of waiting on a refresh round trip.
+const ACCESS_TOKEN_BACKGROUND_LEAD_SECS: u64 = 180;
+/// How often the background refresher re-checks while logged out or after a failure.
+const TOKEN_REFRESH_IDLE_SECS: u64 = 60;
+
+struct CachedToken {
+    token: String,
+    refresh_after: Instant,
+}
+
+/// Cached access token (set after login or refresh). Cleared on logout. Only held to
+/// read or store the token, never across a refresh round trip.
+static ACCESS_TOKEN: Mutex<Option<CachedToken>> = Mutex::new(None);
+/// Held while a refresh runs, so concurrent callers wait for one refresh instead of each
+/// rotating the refresh token; callers with a fresh cached token never take it.
+static TOKEN_REFRESH_LOCK: Mutex<()> = Mutex::new(());
+
+fn cache_access_token(slot: &mut Option<CachedToken>, res: &api::LoginResponse) {
+    let ttl = res
+        .expires_in
+        .unwrap_or(DEFAULT_ACCESS_TOKEN_TTL_SECS)
+        .saturating_sub(ACCESS_TOKEN_REFRESH_MARGIN_SECS);
+    *slot = Some(CachedToken {
+        token: res.access_token.clone(),
+        refresh_after: Instant::now() + Duration::from_secs(ttl),
+    });
 }
 
-#[derive(Serialize)]
+#[derive(Clone, Serialize)]
 pub struct SyncProgressPayload {
     pub phase: String,
     pub current: u64,
@@ -69,6 +96,7 @@ fn get_base_url_mode() -> String {
 #[tauri::command]
 fn set_base_url_mode(mode: String) {
     config::set_base_url_mode(mode);
+    network::invalidate_base_url_cache();
 }
 
 #[tauri::command]
@@ -93,6 +121,7 @@ fn login(email: String, password: String) -> Result<serde_json::Value, String> {
         }
     })?;
     credentials::set_stored(email.trim(), &res.refresh_token);
+    cache_access_token(&mut ACCESS_TOKEN.lock().unwrap_or_else(|e| e.into_inner()), &res);
     Ok(serde_json::json!({
         "access_token": res.access_token,
         "refresh_token": res.refresh_token
@@ -101,6 +130,9 @@ fn login(email: String, password: String) -> Result<serde_json::Value, String> {
 
 #[tauri::command]
 fn logout() {
+    // Wait out an in-flight refresh so it cannot cache a token after we clear it.
+    let _refresh = TOKEN_REFRESH_LOCK.lock().unwrap_or_else(|e| e.into_inner());
+    *ACCESS_TOKEN.lock().unwrap_or_else(|e| e.into_inner()) = None;
     credentials::clear_stored();
 }
 
@@ -109,23 +141,97 @@ fn get_stored_email() -> Option<String> {
     credentials::get_stored().map(|(email, _)| email)
 }
 
+/// The cached access token if it is not yet due for refresh.
+fn fresh_access_token() -> Option<String> {
+    let cached = ACCESS_TOKEN.lock().unwrap_or_else(|e| e.into_inner());
+    cached.as_ref().filter(|c| Instant::now() < c.refresh_after).map(|c| c.token.clone())
+}
+
 #[tauri::command]
 fn get_valid_access_token() -> Option<String> {
+    if let Some(token) = fresh_access_token() {
+        return Some(token);
+    }
+    let _refresh = TOKEN_REFRESH_LOCK.lock().unwrap_or_else(|e| e.into_inner());
+    // Another caller may have refreshed while we waited for the lock.
+    if let Some(token) = fresh_access_token() {
+        return Some(token);
+    }
+    refresh_access_token()
+}
+
+/// Exchange the stored refresh token for a new token pair and cache the access token.
+/// Callers hold TOKEN_REFRESH_LOCK.
+fn refresh_access_token() -> Option<String> {
     let (email, refresh_token) = credentials::get_stored()?;
     let base_url = network::get_base_url();
     let client = ApiClient::new(base_url);
     let res = client.refresh(&refresh_token).ok()?;
     credentials::set_stored(&email, &res.refresh_token);
+    cache_access_token(&mut ACCESS_TOKEN.lock().unwrap_or_else(|e| e.into_inner()), &res);
     Some(res.access_token)
 }
 
-#[tauri::command]
-fn api_me() -> Result<serde_json::Value, String> {
+/// Renew the cached access token shortly before get_valid_access_token() would have
+/// to, so the refresh happens off the command and sync paths.
+fn spawn_token_refresh_loop() {
+    let idle = Duration::from_secs(TOKEN_REFRESH_IDLE_SECS);
+    let lead = Duration::from_secs(ACCESS_TOKEN_BACKGROUND_LEAD_SECS);
+    std::thread::spawn(move || loop {
+        let wait = ACCESS_TOKEN
+            .lock()
+            .unwrap_or_else(|e| e.into_inner())
+            .as_ref()
+            .map(|c| c.refresh_after.saturating_duration_since(Instant::now()).saturating_sub(lead));
+        match wait {
+            Some(w) if w.is_zero() => {
+                let refreshed = {
+                    let _refresh = TOKEN_REFRESH_LOCK.lock().unwrap_or_else(|e| e.into_inner());
+                    refresh_access_token()
+                };
+                if refreshed.is_none() {
+                    log::warn!("Background access token refresh failed; retrying on demand");
+                }
+                // Pause after every attempt so a short-lived token cannot make this spin.
+                std::thread::sleep(idle);
+            }
+            Some(w) => std::thread::sleep(w.min(idle)),
+            None => std::thread::sleep(idle),
+        }
+    });
+}
+
+/// ApiClient for the current base URL with a valid access token, for commands that
+/// need the user to be logged in.
+fn authed_client() -> Result<ApiClient, String> {
     let token = get_valid_access_token().ok_or("Not logged in")?;
-    let base_url = network::get_base_url();
-    let mut client = ApiClient::new(base_url);
+    let mut client = ApiClient::new(network::get_base_url());
     client.set_access_token(Some(token));
-    let user = client.me()?;
+    Ok(client)
+}
+
+/// Drop the cached access token when the server rejected it with 401 (revoked, or the
+/// server restarted with a new secret), so the next call refreshes instead of reusing it
+/// until refresh_after. A token cached by a newer refresh is left alone.
+fn forget_rejected_token(client: &ApiClient, err: &str) {
+    if !err.contains("401 Unauthorized") {
+        return;
+    }
+    let mut cached = ACCESS_TOKEN.lock().unwrap_or_else(|e| e.into_inner());
+    if cached.as_ref().is_some_and(|c| client.access_token.as_deref() == Some(c.token.as_str())) {
+        *cached = None;
+    }
+}
+
+/// Run `call` with an authed client; a 401 drops the cached token (see forget_rejected_token).
+fn with_authed_client<T>(call: impl FnOnce(&ApiClient) -> Result<T, String>) -> Result<T, String> {
+    let client = authed_client()?;
+    call(&client).inspect_err(|e| forget_rejected_token(&client, e))
+}
+
+#[tauri::command]
+fn api_me() -> Result<serde_json::Value, String> {
+    let user = with_authed_client(|client| client.me())?;
     Ok(serde_json::json!({
         "email": user.email,
         "first_name": user.first_name,
@@ -136,11 +242,7 @@ fn api_me() -> Result<serde_json::Value, String> {
 
 #[tauri::command]
 fn api_get_storage() -> Result<serde_json::Value, String> {
-    let token = get_valid_access_token().ok_or("Not logged in")?;
-    let base_url = network::get_base_url();
-    let mut client = ApiClient::new(base_url);
-    client.set_access_token(Some(token));
-    let s = client.get_storage()?;
+    let s = with_authed_client(|client| client.get_storage())?;
     Ok(serde_json::json!({
         "used_bytes": s.used_bytes,
         "limit_bytes": s.limit_bytes,
@@ -152,20 +254,12 @@ fn api_get_storage() -> Result<serde_json::Value, String> {
 
 #[tauri::command]
 fn api_change_password(current_password: String, new_password: String) -> Result<(), String> {
-    let token = get_valid_access_token().ok_or("Not logged in")?;
-    let base_url = network::get_base_url();
-    let mut client = ApiClient::new(base_url);
-    client.set_access_token(Some(token));
-    client.change_password(&current_password, &new_password)
+    with_authed_client(|client| client.change_password(&current_password, &new_password))
 }
 
 #[tauri::command]
 fn api_list_users() -> Result<Vec<serde_json::Value>, String> {
-    let token = get_valid_access_token().ok_or("Not logged in")?;
-    let base_url = network::get_base_url();
-    let mut client = ApiClient::new(base_url);
-    client.set_access_token(Some(token));
-    let users = client.list_users()?;
+    let users = with_authed_client(|client| client.list_users())?;
     Ok(users
         .into_iter()
         .map(|u| {
@@ -182,29 +276,17 @@ fn api_list_users() -> Result<Vec<serde_json::Value>, String> {
 
 #[tauri::command]
 fn api_create_user(email: String, first_name: String, last_name: String) -> Result<serde_json::Value, String> {
-    let token = get_valid_access_token().ok_or("Not logged in")?;
-    let base_url = network::get_base_url();
-    let mut client = ApiClient::new(base_url);
-    client.set_access_token(Some(token));
-    client.create_user(&email, &first_name, &last_name)
+    with_authed_client(|client| client.create_user(&email, &first_name, &last_name))
 }
 
 #[tauri::command]
 fn api_update_user_storage_limit(email: String, limit_bytes: Option<i64>) -> Result<serde_json::Value, String> {
-    let token = get_valid_access_token().ok_or("Not logged in")?;
-    let base_url = network::get_base_url();
-    let mut client = ApiClient::new(base_url);
-    client.set_access_token(Some(token));
-    client.update_user_storage_limit(&email, limit_bytes)
+    with_authed_client(|client| client.update_user_storage_limit(&email, limit_bytes))
 }
 
 #[tauri::command]
 fn api_delete_user(email: String) -> Result<(), String> {
-    let token = get_valid_access_token().ok_or("Not logged in")?;
-    let base_url = network::get_base_url();
-    let mut client = ApiClient::new(base_url);
-    client.set_access_token(Some(token));
-    client.delete_user(&email)
+    with_authed_client(|client| client.delete_user(&email))
 }
 
 #[tauri::command]
@@ -216,6 +298,28 @@ fn open_sync_folder() -> Result<(), String> {
     open::that(path).map_err(|e| e.to_string())
 }
 
+/// Set the sync status from a finished run and emit sync-completed on success.
+/// Shared by the run_sync command and the background loop.
+fn record_sync_result(app: &tauri::AppHandle, result: &Result<(u64, u64, Option<String>), String>) {
+    match result {
+        Ok((bytes_downloaded, bytes_uploaded, warning)) => {
+            if let Some(msg) = warning {
+                sync::set_sync_status(sync::SyncStatus::Warning(msg.clone()));
+            } else {
+                sync::set_sync_status(sync::SyncStatus::Synced);
+            }
+            let _ = app.emit(
+                "sync-completed",
+                serde_json::json!({ "bytesDownloaded": bytes_downloaded, "bytesUploaded": bytes_uploaded }),
+            );
+        }
+        Err(e) => {
+            eprintln!("Brandy Box sync error: {}", e);
+            sync::set_sync_status(sync::SyncStatus::Error(e.clone()));
+        }
+    }
+}
+
 #[tauri::command]
 fn run_sync(app: tauri::AppHandle) -> Result<serde_json::Value, String> {
     if !config::user_has_set_sync_folder() {
@@ -233,25 +337,12 @@ fn run_sync(app: tauri::AppHandle) -> Result<serde_json::Value, String> {
         let mut client = ApiClient::new(base_url);
         client.set_access_token(Some(token));
         let result = sync::run_sync(&mut client, &root);
+        if let Err(e) = &result {
+            forget_rejected_token(&client, e);
+        }
         let sync_ok = result.is_ok();
         let last_sync_at = chrono::Utc::now().to_rfc3339();
-        match &result {
-            Ok((bytes_downloaded, bytes_uploaded, warning)) => {
-                if let Some(msg) = warning {
-                    sync::set_sync_status(sync::SyncStatus::Warning(msg.clone()));
-                } else {
-                    sync::set_sync_status(sync::SyncStatus::Synced);
-                }
-                let _ = app.emit(
-                    "sync-completed",
-                    serde_json::json!({ "bytesDownloaded": bytes_downloaded, "bytesUploaded": bytes_uploaded }),
-                );
-            }
-            Err(e) => {
-                eprintln!("Brandy Box sync error: {}", e);
-                sync::set_sync_status(sync::SyncStatus::Error(e.clone()));
-            }
-        }
+        record_sync_result(&app, &result);
         if let Err(e) = client.client_ping(Some(sync_ok), Some(last_sync_at)) {
             log::warn!("client_ping failed: {}", e);
         }
@@ -271,43 +362,45 @@ const MIN_SETTINGS_WIDTH: u32 = 400;
 const MIN_SETTINGS_HEIGHT: u32 = 400;
 const TRAY_SIDE_MARGIN: i32 = 16;
 
+/// Restore the saved settings window geometry, or place the window near the tray
+/// (typically bottom-right), clamped so it is fully visible in the work area.
+fn place_main_window(win: &tauri::WebviewWindow) {
+    if let Some(geom) = config::get_settings_window_geometry() {
+        if let Some((x, y, w, h)) = parse_geometry(&geom) {
+            let pos = tauri::PhysicalPosition::new(x, y);
+            let size = tauri::PhysicalSize::new(w, h);
+            if win.set_position(pos).is_ok() && win.set_size(size).is_ok() {
+                log::debug!("Restored settings window geometry: {}", geom);
+            }
+        }
+    } else if let Ok(Some(monitor)) = win.primary_monitor() {
+        let work = monitor.work_area();
+        let wa_x = work.position.x;
+        let wa_y = work.position.y;
+        let wa_w = work.size.width as i32;
+        let wa_h = work.size.height as i32;
+        let win_w = DEFAULT_SETTINGS_WIDTH as i32;
+        let win_h = DEFAULT_SETTINGS_HEIGHT as i32;
+        let x = (wa_x + wa_w - win_w - TRAY_SIDE_MARGIN).clamp(wa_x, wa_x + wa_w - win_w);
+        let y = (wa_y + wa_h - win_h - TRAY_SIDE_MARGIN).clamp(wa_y, wa_y + wa_h - win_h);
+        let _ = win.set_position(tauri::PhysicalPosition::new(x, y));
+        let _ = win.set_size(tauri::PhysicalSize::new(
+            DEFAULT_SETTINGS_WIDTH,
+            DEFAULT_SETTINGS_HEIGHT,
+        ));
+        log::debug!(
+            "Positioned settings window near tray: ({}, {}), fully visible",
+            x,
+            y
+        );
+    }
+}
+
 /// Restore or set main (settings) window position and size, then show it.
 #[tauri::command]
 fn show_main_window(app: tauri::AppHandle) {
     if let Some(win) = app.get_webview_window("main") {
-        if let Some(geom) = config::get_settings_window_geometry() {
-            if let Some((x, y, w, h)) = parse_geometry(&geom) {
-                let pos = tauri::PhysicalPosition::new(x, y);
-                let size = tauri::PhysicalSize::new(w, h);
-                if win.set_position(pos).is_ok() && win.set_size(size).is_ok() {
-                    log::debug!("Restored settings window geometry: {}", geom);
-                }
-            }
-        } else {
-            // No stored position: place near tray (typically bottom-right) and ensure fully visible
-            if let Ok(Some(monitor)) = win.primary_monitor() {
-                let work = monitor.work_area();
-                let wa_x = work.position.x;
-                let wa_y = work.position.y;
-                let wa_w = work.size.width as i32;
-                let wa_h = work.size.height as i32;
-                let win_w = DEFAULT_SETTINGS_WIDTH as i32;
-                let win_h = DEFAULT_SETTINGS_HEIGHT as i32;
-                // Tray is usually bottom-right: position window there, clamped to work area
-                let x = (wa_x + wa_w - win_w - TRAY_SIDE_MARGIN).clamp(wa_x, wa_x + wa_w - win_w);
-                let y = (wa_y + wa_h - win_h - TRAY_SIDE_MARGIN).clamp(wa_y, wa_y + wa_h - win_h);
-                let _ = win.set_position(tauri::PhysicalPosition::new(x, y));
-                let _ = win.set_size(tauri::PhysicalSize::new(
-                    DEFAULT_SETTINGS_WIDTH,
-                    DEFAULT_SETTINGS_HEIGHT,
-                ));
-                log::debug!(
-                    "Positioned settings window near tray: ({}, {}), fully visible",
-                    x,
-                    y
-                );
-            }
-        }
+        place_main_window(&win);
         let _ = win.show();
         let _ = win.unminimize();
         let _ = win.set_focus();
@@ -386,15 +479,34 @@ fn get_sync_status() -> serde_json::Value {
 
 fn try_acquire_single_instance_lock() -> bool {
     use fs2::FileExt;
-    if std::env::var("BRANDYBOX_CONFIG_DIR").map(|s| !s.trim().is_empty()).unwrap_or(false) {
+    if config::is_e2e_config() {
         return true;
     }
     let path = config::get_instance_lock_path();
-    if let Some(parent) = path.parent() {
-        let _ = std::fs::create_dir_all(parent);
-    }
-    let f = match std::fs::OpenOptions::new().write(true).create(true).truncate(true).open(&path) {
+    // The lock file's content is never read, so don't truncate it, and only create the
+    // config dir when the open fails because it is missing (first run). std opens files
+    // close-on-exec, so spawned helpers (autostart PowerShell, `open`) never inherit the lock.
+    let open = || {
+        let mut opts = std::fs::OpenOptions::new();
+        opts.write(true).create(true).truncate(false);
+        #[cfg(unix)]
+        {
+            use std::os::unix::fs::OpenOptionsExt;
+            opts.mode(0o600);
+        }
+        opts.open(&path)
+    };
+    let f = match open() {
         Ok(f) => f,
+        Err(e) if e.kind() == std::io::ErrorKind::NotFound => {
+            if let Some(parent) = path.parent() {
+                let _ = std::fs::create_dir_all(parent);
+            }
+            match open() {
+                Ok(f) => f,
+                Err(_) => return false,
+            }
+        }
         Err(_) => return false,
     };
     if f.try_lock_exclusive().is_err() {
@@ -411,7 +523,7 @@ const E2E_SYNC_INITIAL_DELAY_SECS: u64 = 5;
 const E2E_SYNC_INTERVAL_SECS: u64 = 30;
 
 fn spawn_background_sync_loop(app: tauri::AppHandle) {
-    let (initial_delay, interval) = if std::env::var("BRANDYBOX_CONFIG_DIR").map(|s| !s.trim().is_empty()).unwrap_or(false) {
+    let (initial_delay, interval) = if config::is_e2e_config() {
         (E2E_SYNC_INITIAL_DELAY_SECS, E2E_SYNC_INTERVAL_SECS)
     } else {
         (BACKGROUND_SYNC_INITIAL_DELAY_SECS, BACKGROUND_SYNC_INTERVAL_SECS)
@@ -433,23 +545,10 @@ fn spawn_background_sync_loop(app: tauri::AppHandle) {
                         let mut client = ApiClient::new(base_url);
                         client.set_access_token(Some(token));
                         let result = sync::run_sync(&mut client, &root);
-                        match &result {
-                            Ok((bytes_downloaded, bytes_uploaded, warning)) => {
-                                if let Some(msg) = warning {
-                                    sync::set_sync_status(sync::SyncStatus::Warning(msg.clone()));
-                                } else {
-                                    sync::set_sync_status(sync::SyncStatus::Synced);
-                                }
-                                let _ = app.emit(
-                                    "sync-completed",
-                                    serde_json::json!({ "bytesDownloaded": bytes_downloaded, "bytesUploaded": bytes_uploaded }),
-                                );
-                            }
-                            Err(e) => {
-                                eprintln!("Brandy Box sync error: {}", e);
-                                sync::set_sync_status(sync::SyncStatus::Error(e.clone()));
-                            }
+                        if let Err(e) = &result {
+                            forget_rejected_token(&client, e);
                         }
+                        record_sync_result(&app, &result);
                         let _ = app.emit("sync-status", sync::get_sync_status_payload());
                     }
                 }
@@ -469,29 +568,17 @@ pub fn run() {
         .plugin(tauri_plugin_opener::init())
         .plugin(tauri_plugin_notification::init())
         .setup(|app| {
+            let handle = app.handle().clone();
+            sync::set_progress_listener(move |p| {
+                let _ = handle.emit(
+                    "sync-progress",
+                    SyncProgressPayload { phase: p.phase.clone(), current: p.current, total: p.total },
+                );
+            });
+            spawn_token_refresh_loop();
             spawn_background_sync_loop(app.handle().clone());
             if let Some(win) = app.get_webview_window("main") {
-                if let Some(geom) = config::get_settings_window_geometry() {
-                    if let Some((x, y, w, h)) = parse_geometry(&geom) {
-                        let _ = win.set_position(tauri::PhysicalPosition::new(x, y));
-                        let _ = win.set_size(tauri::PhysicalSize::new(w, h));
-                    }
-                } else if let Ok(Some(monitor)) = win.primary_monitor() {
-                    let work = monitor.work_area();
-                    let wa_x = work.position.x;
-                    let wa_y = work.position.y;
-                    let wa_w = work.size.width as i32;
-                    let wa_h = work.size.height as i32;
-                    let win_w = DEFAULT_SETTINGS_WIDTH as i32;
-                    let win_h = DEFAULT_SETTINGS_HEIGHT as i32;
-                    let x = (wa_x + wa_w - win_w - TRAY_SIDE_MARGIN).clamp(wa_x, wa_x + wa_w - win_w);
-                    let y = (wa_y + wa_h - win_h - TRAY_SIDE_MARGIN).clamp(wa_y, wa_y + wa_h - win_h);
-                    let _ = win.set_position(tauri::PhysicalPosition::new(x, y));
-                    let _ = win.set_size(tauri::PhysicalSize::new(
-                        DEFAULT_SETTINGS_WIDTH,
-                        DEFAULT_SETTINGS_HEIGHT,
-                    ));
-                }
+                place_main_window(&win);
             }
             Ok(())
         })
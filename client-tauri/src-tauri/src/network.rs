@@ -1,46 +1,180 @@
 //! Resolve backend base URL: LAN vs Cloudflare (matches Python client logic).
 
-const LAN_HOST: &str = "192.168.0.150";
+use std::net::{IpAddr, Ipv4Addr, SocketAddr, SocketAddrV4, TcpStream, UdpSocket};
+use std::sync::{Mutex, OnceLock};
+use std::time::{Duration, Instant};
+
+const LAN_HOST: Ipv4Addr = Ipv4Addr::new(192, 168, 0, 150);
 #[allow(dead_code)]
 const LAN_NETWORK_NAME: &str = "brandstaetter";
-const BACKEND_PORT: &str = "8081";
+const BACKEND_PORT: u16 = 8081;
 const CLOUDFLARE_URL: &str = "https://brandybox.brandstaetter.rocks";
+/// How long an automatic LAN/remote decision is reused before probing again.
+const LAN_PROBE_TTL: Duration = Duration::from_secs(30);
+
+/// Last automatic-mode probe result and when it was taken.
+static LAN_PROBE_CACHE: Mutex<Option<(Instant, bool)>> = Mutex::new(None);
+/// Held while a probe runs; see `cached_is_local_network`.
+static LAN_PROBE_LOCK: Mutex<()> = Mutex::new(());
+/// Last LAN/remote decision that was logged; see `log_probe_result`.
+static LAST_LOGGED_LOCAL: Mutex<Option<bool>> = Mutex::new(None);
+
+/// BRANDYBOX_BASE_URL (trimmed, without trailing slash), read once per process.
+fn base_url_override() -> Option<&'static str> {
+    static OVERRIDE: OnceLock<Option<String>> = OnceLock::new();
+    OVERRIDE
+        .get_or_init(|| {
+            std::env::var("BRANDYBOX_BASE_URL")
+                .ok()
+                .map(|s| s.trim().trim_end_matches('/').to_string())
+                .filter(|s| !s.is_empty())
+        })
+        .as_deref()
+}
+
+/// A TCP connect to the LAN backend answers within a few ms on the home network.
+const LAN_PROBE_TIMEOUT: Duration = Duration::from_millis(500);
 
+/// True if the backend port on the LAN host accepts a TCP connection. A bare
+/// connect is enough to tell LAN from remote; building an HTTP client and issuing
+/// a request only added setup cost and a 2 s timeout when away from home.
 fn is_local_network() -> bool {
-    if let Ok(override_url) = std::env::var("BRANDYBOX_BASE_URL") {
-        if !override_url.trim().is_empty() {
-            return false; // caller will use override
+    #[cfg(target_os = "linux")]
+    {
+        // Away from home no interface is on the LAN subnet; skip the connect entirely.
+        if let Ok(table) = std::fs::read_to_string("/proc/net/route") {
+            if !host_on_link(&table, LAN_HOST) {
+                return false;
+            }
+        }
+    }
+    #[cfg(not(target_os = "linux"))]
+    {
+        // No route table to read: ask the OS which source address it would use instead.
+        if source_addr_on_lan_subnet() == Some(false) {
+            return false;
         }
     }
-    // Try LAN reachability (short timeout)
-    let url = format!("http://{}:{}/api/users/me", LAN_HOST, BACKEND_PORT);
-    let client = reqwest::blocking::Client::builder()
-        .timeout(std::time::Duration::from_secs(2))
-        .build();
-    if let Ok(c) = client {
-        if let Ok(r) = c.get(&url).send() {
-            if r.status().as_u16() == 200 || r.status().as_u16() == 401 {
-                return true;
+    let addr = SocketAddr::V4(SocketAddrV4::new(LAN_HOST, BACKEND_PORT));
+    TcpStream::connect_timeout(&addr, LAN_PROBE_TIMEOUT).is_ok()
+}
+
+/// Whether the local address the OS picks for reaching LAN_HOST is in LAN_HOST's /24.
+/// Connecting a UDP socket only selects a route and source address; no packet is sent.
+/// None if the route lookup itself fails.
+#[cfg_attr(target_os = "linux", allow(dead_code))]
+fn source_addr_on_lan_subnet() -> Option<bool> {
+    let socket = UdpSocket::bind(SocketAddrV4::new(Ipv4Addr::UNSPECIFIED, 0)).ok()?;
+    socket.connect(SocketAddrV4::new(LAN_HOST, BACKEND_PORT)).ok()?;
+    match socket.local_addr().ok()?.ip() {
+        IpAddr::V4(src) => Some(src.octets()[..3] == LAN_HOST.octets()[..3]),
+        IpAddr::V6(_) => Some(false),
+    }
+}
+
+/// True if a /proc/net/route table has an up route, other than the default route,
+/// whose subnet contains `host` (the home LAN on an interface, or routed via a VPN).
+#[cfg_attr(not(target_os = "linux"), allow(dead_code))]
+fn host_on_link(route_table: &str, host: Ipv4Addr) -> bool {
+    const RTF_UP: u32 = 0x1;
+    // /proc/net/route prints addresses as hex of the in-memory (network order) u32.
+    let host = u32::from_le_bytes(host.octets());
+    route_table.lines().skip(1).any(|line| {
+        let f: Vec<&str> = line.split_whitespace().collect();
+        if f.len() < 8 {
+            return false;
+        }
+        let hex = |s: &str| u32::from_str_radix(s, 16).ok();
+        match (hex(f[1]), hex(f[3]), hex(f[7])) {
+            (Some(dest), Some(flags), Some(mask)) => flags & RTF_UP != 0 && mask != 0 && host & mask == dest,
+            _ => false,
+        }
+    })
+}
+
+/// `is_local_network()`, reused for `LAN_PROBE_TTL`. get_base_url() runs for every
+/// Tauri command, and an unreachable LAN host costs the full probe timeout each time.
+fn cached_is_local_network() -> bool {
+    if let Some(local) = fresh_probe_result() {
+        return local;
+    }
+    // Single flight: concurrent callers (sync loop, settings window) wait for one probe
+    // and reuse its result instead of each probing the LAN host.
+    let _probe = LAN_PROBE_LOCK.lock().unwrap_or_else(|e| e.into_inner());
+    if let Some(local) = fresh_probe_result() {
+        return local;
+    }
+    let local = is_local_network();
+    if let Ok(mut guard) = LAN_PROBE_CACHE.lock() {
+        *guard = Some((Instant::now(), local));
+    }
+    log_probe_result(local);
+    local
+}
+
+/// Log the chosen backend only when the decision flips, not on every re-probe.
+fn log_probe_result(local: bool) {
+    if let Ok(mut last) = LAST_LOGGED_LOCAL.lock() {
+        if *last != Some(local) {
+            *last = Some(local);
+            if local {
+                log::info!("Using LAN backend http://{}:{}", LAN_HOST, BACKEND_PORT);
+            } else {
+                log::info!("Using remote backend {}", CLOUDFLARE_URL);
             }
         }
     }
-    false
+}
+
+fn fresh_probe_result() -> Option<bool> {
+    let guard = LAN_PROBE_CACHE.lock().ok()?;
+    match *guard {
+        Some((at, local)) if at.elapsed() < LAN_PROBE_TTL => Some(local),
+        _ => None,
+    }
+}
+
+/// Forget the cached LAN probe so the next get_base_url() probes again.
+pub fn invalidate_base_url_cache() {
+    if let Ok(mut guard) = LAN_PROBE_CACHE.lock() {
+        *guard = None;
+    }
 }
 
 pub fn get_base_url() -> String {
-    if let Ok(override_url) = std::env::var("BRANDYBOX_BASE_URL") {
-        let s = override_url.trim();
-        if !s.is_empty() {
-            return s.trim_end_matches('/').to_string();
-        }
+    if let Some(url) = base_url_override() {
+        return url.to_string();
     }
     let mode = crate::config::get_base_url_mode();
     if mode == "manual" {
         return crate::config::get_manual_base_url().trim_end_matches('/').to_string();
     }
-    if is_local_network() {
+    if cached_is_local_network() {
         format!("http://{}:{}", LAN_HOST, BACKEND_PORT)
     } else {
         CLOUDFLARE_URL.to_string()
     }
 }
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    const HEADER: &str = "Iface\tDestination\tGateway \tFlags\tRefCnt\tUse\tMetric\tMask\t\tMTU\tWindow\tIRTT\n";
+
+    #[test]
+    fn host_on_link_ignores_the_default_route() {
+        let host = LAN_HOST;
+        let home = format!(
+            "{}eth0\t00000000\t0100A8C0\t0003\t0\t0\t100\t00000000\t0\t0\t0\neth0\t0000A8C0\t00000000\t0001\t0\t0\t100\t00FFFFFF\t0\t0\t0\n",
+            HEADER
+        );
+        assert!(host_on_link(&home, host));
+        let away = format!(
+            "{}wlan0\t00000000\t0101A8C0\t0003\t0\t0\t600\t00000000\t0\t0\t0\nwlan0\t0001A8C0\t00000000\t0001\t0\t0\t600\t00FFFFFF\t0\t0\t0\n",
+            HEADER
+        );
+        assert!(!host_on_link(&away, host));
+        assert!(!host_on_link(HEADER, host));
+    }
+}
@@ -8,53 +8,142 @@ use crate::api::ApiClient;
 use crate::config;
 use sha2::{Digest, Sha256};
 use serde::{Deserialize, Serialize};
-use std::collections::{HashMap, HashSet};
-use std::path::Path;
+use std::cmp::Reverse;
+use std::collections::{BinaryHeap, HashMap, HashSet};
+use std::path::{Path, PathBuf, MAIN_SEPARATOR, MAIN_SEPARATOR_STR};
+use std::sync::atomic::{AtomicBool, AtomicUsize, Ordering};
+use std::sync::Arc;
 
 const SYNC_IGNORE: &[&str] = &[".directory", "Thumbs.db", "Desktop.ini", ".DS_Store"];
-#[allow(dead_code)]
+/// Concurrent transfers per phase; the shared HTTP client keeps one pooled connection each.
 const SYNC_MAX_WORKERS: usize = 8;
+/// Minimum time between sync-state checkpoints written while downloading.
+const STATE_CHECKPOINT_INTERVAL: std::time::Duration = std::time::Duration::from_secs(5);
 
-#[derive(Default, Clone, Serialize, Deserialize)]
+#[derive(Default, Clone, PartialEq, Serialize, Deserialize)]
 struct SyncStateFile {
     paths: Vec<String>,
     downloaded_paths: Vec<String>,
     file_hashes: HashMap<String, String>,
+    /// Local content hashes keyed by path; absent in state files from older clients.
+    #[serde(default)]
+    local_hashes: HashMap<String, LocalHash>,
 }
 
+/// SHA-256 of a local file as of the given mtime, size and inode.
+#[derive(Clone, PartialEq, Serialize, Deserialize)]
+struct LocalHash {
+    hash: String,
+    mtime_ns: u64,
+    size: u64,
+    /// Inode number (0 where unavailable); absent in state files from older clients.
+    #[serde(default)]
+    ino: u64,
+}
+
+/// Ignored if any directory component is .git or the file name is in SYNC_IGNORE.
+/// Splits on both separators in place instead of normalizing into a new string.
 fn is_ignored(path_str: &str) -> bool {
-    let normalized = path_str.replace('\\', "/");
-    if normalized.contains("/.git/") || normalized.starts_with(".git/") {
-        return true;
+    let mut components = path_str.split(['/', '\\']);
+    let name = components.next_back().unwrap_or("");
+    SYNC_IGNORE.contains(&name) || components.any(|c| c == ".git")
+}
+
+/// What the listing walk learned about a local file from its single stat.
+struct LocalFile {
+    mtime: f64,
+    mtime_ns: u64,
+    size: u64,
+    ino: u64,
+}
+
+impl LocalFile {
+    /// Memo entry recording `hash` as this file's content at its current stat.
+    fn memo(&self, hash: String) -> LocalHash {
+        LocalHash { hash, mtime_ns: self.mtime_ns, size: self.size, ino: self.ino }
+    }
+}
+
+/// Inode number, so a file replaced by another with the same size and mtime (cp -p,
+/// rsync -t, an editor's rename-over-save) is not mistaken for the memoized one.
+#[cfg(unix)]
+fn file_ino(meta: &std::fs::Metadata) -> u64 {
+    use std::os::unix::fs::MetadataExt;
+    meta.ino()
+}
+
+#[cfg(not(unix))]
+fn file_ino(_meta: &std::fs::Metadata) -> u64 {
+    0
+}
+
+/// Sync path and stat for a regular file under `root`, or None if it is ignored.
+fn local_file_entry(root: &Path, path: &Path, meta: &std::fs::Metadata) -> Option<(String, LocalFile)> {
+    let rel = path.strip_prefix(root).ok()?;
+    let path_str = if MAIN_SEPARATOR == '/' {
+        rel.to_string_lossy().into_owned()
+    } else {
+        rel.to_string_lossy().replace(MAIN_SEPARATOR, "/")
+    };
+    if is_ignored(&path_str) {
+        return None;
     }
-    let name = Path::new(&normalized).file_name().and_then(|n| n.to_str()).unwrap_or("");
-    SYNC_IGNORE.contains(&name)
+    let since_epoch = meta.modified().ok()?.duration_since(std::time::UNIX_EPOCH).unwrap_or_default();
+    let file = LocalFile {
+        mtime: since_epoch.as_secs_f64(),
+        mtime_ns: u64::try_from(since_epoch.as_nanos()).unwrap_or(u64::MAX),
+        size: meta.len(),
+        ino: file_ino(meta),
+    };
+    Some((path_str, file))
+}
+
+/// Every regular file below `dir`, with sync paths relative to `root`.
+fn walk_local(root: &Path, dir: &Path) -> Vec<(String, LocalFile)> {
+    // Everything under a .git directory is ignored, so don't descend into one at all.
+    walkdir::WalkDir::new(dir)
+        .into_iter()
+        .filter_entry(|e| e.depth() == 0 || !(e.file_type().is_dir() && e.file_name() == ".git"))
+        .filter_map(|e| e.ok())
+        .filter(|e| e.file_type().is_file())
+        .filter_map(|e| local_file_entry(root, e.path(), &e.metadata().ok()?))
+        .collect()
 }
 
-fn list_local(root: &Path) -> Vec<(String, f64)> {
+/// Files in the sync folder. Top-level directories are walked on the worker pool, so
+/// directory reads overlap instead of queueing behind each other on a cold cache or a
+/// network filesystem; files directly in `root` are listed here.
+fn list_local(root: &Path) -> Vec<(String, LocalFile)> {
     let mut out = Vec::new();
-    for e in walkdir::WalkDir::new(root).into_iter().filter_map(|e| e.ok()) {
-        if !e.file_type().is_file() {
-            continue;
-        }
-        let rel = match e.path().strip_prefix(root) {
-            Ok(r) => r,
-            Err(_) => continue,
-        };
-        let path_str = rel.to_string_lossy().replace('\\', "/");
-        if is_ignored(&path_str) {
-            continue;
-        }
-        if let Ok(meta) = e.metadata() {
-            if let Ok(mtime) = meta.modified() {
-                let t = mtime.duration_since(std::time::UNIX_EPOCH).unwrap_or_default().as_secs_f64();
-                out.push((path_str, t));
+    let mut subdirs = Vec::new();
+    let Ok(entries) = std::fs::read_dir(root) else {
+        return out;
+    };
+    for e in entries.filter_map(|e| e.ok()) {
+        let Ok(file_type) = e.file_type() else { continue };
+        if file_type.is_dir() {
+            if e.file_name() != ".git" {
+                subdirs.push(e.path());
+            }
+        } else if file_type.is_file() {
+            if let Some(entry) = e.metadata().ok().and_then(|meta| local_file_entry(root, &e.path(), &meta)) {
+                out.push(entry);
             }
         }
     }
+    let _ = for_each_parallel(&subdirs, |dir| Ok(walk_local(root, dir)), |_, files| out.extend(files));
     out
 }
 
+/// Local path for a sync path ("dir/file.txt"); only Windows needs '/' rewritten.
+fn to_local_path(local_root: &Path, path: &str) -> PathBuf {
+    if MAIN_SEPARATOR == '/' {
+        local_root.join(path)
+    } else {
+        local_root.join(path.replace('/', MAIN_SEPARATOR_STR))
+    }
+}
+
 fn compute_file_hash(path: &Path) -> Option<String> {
     let mut file = std::fs::File::open(path).ok()?;
     let mut hasher = Sha256::new();
@@ -70,23 +159,90 @@ fn compute_file_hash(path: &Path) -> Option<String> {
     Some(format!("{:x}", hasher.finalize()))
 }
 
-fn load_sync_state() -> SyncStateFile {
-    let path = config::get_sync_state_path();
-    if !path.exists() {
-        return SyncStateFile::default();
+fn mtime_ns(meta: &std::fs::Metadata) -> Option<u64> {
+    let d = meta.modified().ok()?.duration_since(std::time::UNIX_EPOCH).ok()?;
+    u64::try_from(d.as_nanos()).ok()
+}
+
+/// The memoized hash for `path` if it was taken at the file's current (mtime, size, inode).
+fn memo_hash<'a>(hashes: &'a HashMap<String, LocalHash>, path: &str, local: &LocalFile) -> Option<&'a str> {
+    let cached = hashes.get(path)?;
+    (cached.mtime_ns == local.mtime_ns && cached.size == local.size && cached.ino == local.ino)
+        .then_some(cached.hash.as_str())
+}
+
+/// Hash of `local_path`, reused from `hashes` while its mtime, size and inode (from the
+/// listing stat) are unchanged, so files that did not change since the last sync are not read.
+fn cached_file_hash(
+    hashes: &mut HashMap<String, LocalHash>,
+    path: &str,
+    local_path: &Path,
+    local: &LocalFile,
+) -> Option<String> {
+    if let Some(hash) = memo_hash(hashes, path, local) {
+        return Some(hash.to_string());
     }
-    if let Ok(s) = std::fs::read_to_string(&path) {
-        if let Ok(f) = serde_json::from_str(&s) {
-            return f;
-        }
+    let hash = compute_file_hash(local_path)?;
+    hashes.insert(path.to_string(), local.memo(hash.clone()));
+    Some(hash)
+}
+
+/// Whether the local file could have the remote item's content: the server lists a hash
+/// and, when it lists a size (API 0.3.0+), the sizes agree. Otherwise no read is needed.
+fn may_match_remote(local: &LocalFile, remote: &crate::api::FileItem) -> bool {
+    remote.hash.is_some() && remote.size.is_none_or(|size| size == local.size)
+}
+
+/// Returns the server hash when the local file has the same content as the remote item.
+fn local_matches_remote<'a>(
+    hashes: &mut HashMap<String, LocalHash>,
+    path: &str,
+    local_path: &Path,
+    local: &LocalFile,
+    remote: &'a crate::api::FileItem,
+) -> Option<&'a str> {
+    if !may_match_remote(local, remote) {
+        return None;
+    }
+    let server_hash = remote.hash.as_deref()?;
+    let local_hash = cached_file_hash(hashes, path, local_path, local)?;
+    if local_hash == server_hash {
+        Some(server_hash)
+    } else {
+        None
     }
-    SyncStateFile::default()
 }
 
-fn save_sync_state(state: &SyncStateFile) {
+fn load_sync_state() -> SyncStateFile {
     let path = config::get_sync_state_path();
-    let _ = std::fs::create_dir_all(path.parent().unwrap_or(Path::new(".")));
-    let _ = std::fs::write(path, serde_json::to_string_pretty(state).unwrap_or_default());
+    // A missing file is just a read error here; no separate exists() stat needed.
+    std::fs::read(&path)
+        .ok()
+        .and_then(|bytes| serde_json::from_slice(&bytes).ok())
+        .unwrap_or_default()
+}
+
+/// Write state compactly via a temp file + rename: a crash mid-write must not leave a torn
+/// file, which would load as empty state and make the next sync look like a new device.
+/// `durable` also fsyncs it; checkpoints skip that so a long download run does not flush
+/// the disk every few seconds, and the end-of-run save makes the whole batch durable.
+fn save_sync_state(state: &SyncStateFile, durable: bool) {
+    let path = config::get_sync_state_path_ensured();
+    let content = match serde_json::to_vec(state) {
+        Ok(c) => c,
+        Err(e) => {
+            log::warn!("Could not serialize sync state: {}", e);
+            return;
+        }
+    };
+    let written = if durable {
+        config::write_atomic_durable(&path, &content)
+    } else {
+        config::write_atomic(&path, &content)
+    };
+    if let Err(e) = written {
+        log::warn!("Could not write sync state {}: {}", path.display(), e);
+    }
 }
 
 #[derive(Clone)]
@@ -137,18 +293,243 @@ pub fn get_sync_progress() -> Option<SyncProgress> {
     SYNC_PROGRESS.lock().ok().and_then(|g| g.clone())
 }
 
+type ProgressListener = Box<dyn Fn(&SyncProgress) + Send>;
+
+static PROGRESS_LISTENER: std::sync::Mutex<Option<ProgressListener>> = std::sync::Mutex::new(None);
+
+/// Register a callback invoked on every progress update (the app emits it as an event
+/// so the settings window does not have to poll).
+pub fn set_progress_listener(listener: impl Fn(&SyncProgress) + Send + 'static) {
+    let _ = PROGRESS_LISTENER.lock().map(|mut g| *g = Some(Box::new(listener)));
+}
+
+/// Minimum time between progress events, so a burst of small transfers emits at most
+/// ~20 events per second to the webview instead of one per file.
+const PROGRESS_EMIT_INTERVAL: std::time::Duration = std::time::Duration::from_millis(50);
+
+/// When the listener was last notified, and for which phase; see `progress_event_due`.
+static LAST_PROGRESS_EMIT: std::sync::Mutex<Option<(std::time::Instant, String)>> = std::sync::Mutex::new(None);
+
+/// Whether an update should reach the listener: a change of phase (including the switch
+/// to "idle") and current == total always do, others once per PROGRESS_EMIT_INTERVAL.
+fn progress_event_due(
+    last_emit: &mut Option<(std::time::Instant, String)>,
+    phase: &str,
+    current: u64,
+    total: u64,
+) -> bool {
+    let now = std::time::Instant::now();
+    let throttled = last_emit
+        .as_ref()
+        .is_some_and(|(at, last_phase)| last_phase == phase && now.duration_since(*at) < PROGRESS_EMIT_INTERVAL);
+    if current < total && throttled {
+        return false;
+    }
+    *last_emit = Some((now, phase.to_string()));
+    true
+}
+
+/// Record progress for get_sync_progress() (always the latest value) and notify the
+/// listener, throttled by `progress_event_due`.
 fn set_progress(phase: &str, current: u64, total: u64) {
-    let _ = SYNC_PROGRESS.lock().map(|mut g| *g = Some(SyncProgress { phase: phase.to_string(), current, total }));
+    let progress = SyncProgress { phase: phase.to_string(), current, total };
+    let due = LAST_PROGRESS_EMIT
+        .lock()
+        .map(|mut last| progress_event_due(&mut last, phase, current, total))
+        .unwrap_or(true);
+    if due {
+        if let Ok(listener) = PROGRESS_LISTENER.lock() {
+            if let Some(notify) = listener.as_ref() {
+                notify(&progress);
+            }
+        }
+    }
+    let _ = SYNC_PROGRESS.lock().map(|mut g| *g = Some(progress));
+}
+
+/// Runs `job` for every item on up to SYNC_MAX_WORKERS threads and hands each result to
+/// `on_result` on the calling thread, in completion order. After the first error no new
+/// jobs start; jobs already running finish and are reported, then the error is returned.
+/// A job failing with api::CANCELLED (cut short because of that error) never masks it.
+/// Workers claim items one at a time and at most SYNC_MAX_WORKERS results wait in the
+/// channel, so in-flight work stays bounded however long `items` is.
+fn for_each_parallel<T: Sync, R: Send>(
+    items: &[T],
+    job: impl Fn(&T) -> Result<R, String> + Sync,
+    mut on_result: impl FnMut(&T, R),
+) -> Result<(), String> {
+    let next = AtomicUsize::new(0);
+    let failed = AtomicBool::new(false);
+    std::thread::scope(|scope| {
+        let (tx, rx) = std::sync::mpsc::sync_channel(SYNC_MAX_WORKERS);
+        for _ in 0..SYNC_MAX_WORKERS.min(items.len()) {
+            let tx = tx.clone();
+            let (next, failed, job) = (&next, &failed, &job);
+            scope.spawn(move || {
+                while !failed.load(Ordering::Relaxed) {
+                    let i = next.fetch_add(1, Ordering::Relaxed);
+                    let Some(item) = items.get(i) else { break };
+                    let result = job(item);
+                    if result.is_err() {
+                        failed.store(true, Ordering::Relaxed);
+                    }
+                    if tx.send((i, result)).is_err() {
+                        break;
+                    }
+                }
+            });
+        }
+        drop(tx);
+        let mut first_err = None;
+        for (i, result) in rx {
+            match result {
+                Ok(r) => on_result(&items[i], r),
+                Err(e) => {
+                    if first_err.as_deref().is_none_or(|f| f == crate::api::CANCELLED) {
+                        first_err = Some(e);
+                    }
+                }
+            }
+        }
+        first_err.map_or(Ok(()), Err)
+    })
+}
+
+/// Remove directories left empty by local deletes, deepest first, then their parents up
+/// to (not including) `local_root`. Each directory is tried once; remove_dir refuses a
+/// non-empty one, so no listing is needed.
+fn remove_empty_dirs(local_root: &Path, dirs: HashSet<PathBuf>) {
+    let mut queued: HashSet<PathBuf> = dirs.clone();
+    let mut heap: BinaryHeap<(usize, PathBuf)> = dirs.into_iter().map(|d| (d.components().count(), d)).collect();
+    while let Some((depth, dir)) = heap.pop() {
+        if dir == local_root || !dir.starts_with(local_root) || std::fs::remove_dir(&dir).is_err() {
+            continue;
+        }
+        if let Some(parent) = dir.parent() {
+            if queued.insert(parent.to_path_buf()) {
+                heap.push((depth - 1, parent.to_path_buf()));
+            }
+        }
+    }
+}
+
+enum Transfer<'a> {
+    Download(&'a String),
+    Upload(&'a String),
+}
+
+enum Transferred {
+    Download(Fetched),
+    /// Bytes sent, or None when the file disappeared before its turn.
+    Upload(Option<u64>),
+}
+
+enum Fetched {
+    Downloaded { len: u64, hash: String, meta: std::fs::Metadata },
+    /// Permission denied locally or gone on the server; reported as a warning.
+    Skipped,
+}
+
+/// Sibling temp file for a download: the full file name plus ".tmp_download", so files
+/// that differ only by extension (report.pdf, report.docx) never share one while they
+/// download in parallel.
+fn download_tmp_path(local_path: &Path) -> PathBuf {
+    let mut name = local_path.file_name().unwrap_or_default().to_os_string();
+    name.push(".tmp_download");
+    local_path.with_file_name(name)
+}
+
+/// Download one file via a sibling temp file (`download_tmp_path`) renamed into place. The file
+/// gets the server's mtime, so the next sync sees equal mtimes and has nothing to compare.
+fn download_one(client: &ApiClient, path: &str, remote_mtime: Option<f64>, local_root: &Path) -> Result<Fetched, String> {
+    let local_path = to_local_path(local_root, path);
+    if let Some(parent) = local_path.parent() {
+        let _ = std::fs::create_dir_all(parent);
+    }
+    let tmp_path = download_tmp_path(&local_path);
+    let mut tmp_file = match std::fs::File::create(&tmp_path) {
+        Ok(f) => f,
+        Err(e) if e.kind() == std::io::ErrorKind::PermissionDenied => {
+            log::warn!("Download {}: permission denied, skipping", path);
+            return Ok(Fetched::Skipped);
+        }
+        Err(e) => return Err(format!("Download {}: {}", path, e)),
+    };
+    let downloaded = client.download_file_to(path, &mut tmp_file);
+    if downloaded.is_ok() {
+        if let Some(since_epoch) = remote_mtime.and_then(|m| std::time::Duration::try_from_secs_f64(m).ok()) {
+            if let Err(e) = tmp_file.set_modified(std::time::UNIX_EPOCH + since_epoch) {
+                log::debug!("Download {}: could not set mtime: {}", path, e);
+            }
+        }
+    }
+    drop(tmp_file);
+    match downloaded {
+        Ok((len, hash)) => {
+            if let Err(e) = std::fs::rename(&tmp_path, &local_path) {
+                let _ = std::fs::remove_file(&tmp_path);
+                return Err(format!("Download {}: failed to rename tmp to final: {}", path, e));
+            }
+            let meta = std::fs::metadata(&local_path).map_err(|e| format!("Download {}: {}", path, e))?;
+            Ok(Fetched::Downloaded { len, hash, meta })
+        }
+        Err(e) => {
+            let _ = std::fs::remove_file(&tmp_path);
+            if e == crate::api::CANCELLED {
+                Err(e)
+            } else if e.contains("404") {
+                log::debug!("Download {}: 404, file no longer on server", path);
+                // remove_file fails on a missing path or a directory; no stat first.
+                let _ = std::fs::remove_file(&local_path);
+                Ok(Fetched::Skipped)
+            } else {
+                Err(format!("Download {}: {}", path, e))
+            }
+        }
+    }
+}
+
+/// Upload one file; Ok(None) when it disappeared locally before its turn.
+fn upload_one(client: &ApiClient, path: &str, local_root: &Path) -> Result<Option<u64>, String> {
+    let full = to_local_path(local_root, path);
+    match std::fs::metadata(&full) {
+        Ok(meta) if meta.is_file() => {
+            client.upload_file_from_path(path, &full).map_err(|e| {
+                if e == crate::api::CANCELLED {
+                    e
+                } else {
+                    format!("Upload {}: {}", path, e)
+                }
+            })?;
+            Ok(Some(meta.len()))
+        }
+        _ => {
+            log::debug!("Upload {}: file no longer present, skipping", path);
+            Ok(None)
+        }
+    }
 }
 
 pub fn run_sync(client: &mut ApiClient, local_root: &Path) -> Result<(u64, u64, Option<String>), String> {
     let mut state = load_sync_state();
-    let last_synced: HashSet<String> = state.paths.iter().cloned().collect();
+    // Kept to skip rewriting the state file when a run changes nothing (the usual case).
+    let loaded_state = state.clone();
+    let last_synced: HashSet<String> = state.paths.iter().filter(|p| !is_ignored(p)).cloned().collect();
     let prev_downloaded: HashSet<String> = state.downloaded_paths.iter().cloned().collect();
 
     set_progress("listing", 0, 0);
-    let local_list = list_local(local_root);
-    let remote_list = client.list_files()?;
+    // Both listings (and last_synced above) drop ignored paths up front, so nothing
+    // derived from them below needs to check is_ignored again. The local walk runs on
+    // its own thread while this one waits on the server, so listing takes the longer
+    // of the two instead of their sum.
+    let (local_list, remote_list) = std::thread::scope(|scope| {
+        let walk = scope.spawn(|| list_local(local_root));
+        let remote = client.list_files();
+        let local = walk.join().unwrap_or_else(|panic| std::panic::resume_unwind(panic));
+        (local, remote)
+    });
+    let mut remote_list = remote_list?;
+    remote_list.retain(|item| !is_ignored(&item.path));
 
     log::info!(
         "Sync: {} remote, {} local (sync_folder={})",
@@ -157,7 +538,7 @@ pub fn run_sync(client: &mut ApiClient, local_root: &Path) -> Result<(u64, u64,
         local_root.display()
     );
 
-    let local_by_path: HashMap<String, f64> = local_list.iter().cloned().collect();
+    let local_by_path: HashMap<String, f64> = local_list.iter().map(|(p, f)| (p.clone(), f.mtime)).collect();
     let remote_by_path: HashMap<String, f64> = remote_list.iter().map(|i| (i.path.clone(), i.mtime)).collect();
     let remote_hashes: HashMap<String, String> = remote_list.iter().filter_map(|i| i.hash.clone().map(|h| (i.path.clone(), h))).collect();
     let remote_by_item: HashMap<String, &crate::api::FileItem> = remote_list.iter().map(|i| (i.path.clone(), i)).collect();
@@ -165,7 +546,12 @@ pub fn run_sync(client: &mut ApiClient, local_root: &Path) -> Result<(u64, u64,
     let current_local: HashSet<String> = local_by_path.keys().cloned().collect();
     let current_remote: HashSet<String> = remote_by_path.keys().cloned().collect();
 
-    let mut to_delete_remote: HashSet<String> = last_synced.difference(&current_local).filter(|p| !is_ignored(p)).cloned().collect();
+    // Only paths the server still lists need a DELETE; anything else would just 404.
+    let mut to_delete_remote: HashSet<String> = last_synced
+        .difference(&current_local)
+        .filter(|p| current_remote.contains(*p))
+        .cloned()
+        .collect();
 
     // Safety: never delete more files on server than we have locally when the number is large
     if to_delete_remote.len() > 50 && to_delete_remote.len() > current_local.len() {
@@ -179,18 +565,19 @@ pub fn run_sync(client: &mut ApiClient, local_root: &Path) -> Result<(u64, u64,
 
     let to_delete_local: HashSet<String> = last_synced.difference(&current_remote).cloned().collect();
 
+    // Deepest paths first; each depth is counted once per path, not once per comparison.
     let mut to_del_remote: Vec<String> = to_delete_remote.into_iter().collect();
-    to_del_remote.sort_by(|a, b| b.matches('/').count().cmp(&a.matches('/').count()));
+    to_del_remote.sort_by_cached_key(|p| Reverse(p.matches('/').count()));
 
     let mut to_del_local: Vec<String> = to_delete_local.into_iter().collect();
-    to_del_local.sort_by(|a, b| b.matches('/').count().cmp(&a.matches('/').count()));
+    to_del_local.sort_by_cached_key(|p| Reverse(p.matches('/').count()));
 
     let to_del_local_set: HashSet<String> = to_del_local.iter().cloned().collect();
     let to_del_remote_set: HashSet<String> = to_del_remote.iter().cloned().collect();
 
     let total_work = to_del_remote.len() + to_del_local.len()
-        + current_remote.difference(&current_local).filter(|p| !is_ignored(p)).count()
-        + current_local.difference(&current_remote).filter(|p| !is_ignored(p)).count();
+        + current_remote.difference(&current_local).count()
+        + current_local.difference(&current_remote).count();
     let total_work = total_work as u64;
     let mut done = 0u64;
 
@@ -199,81 +586,73 @@ pub fn run_sync(client: &mut ApiClient, local_root: &Path) -> Result<(u64, u64,
         client.delete_file(path).map_err(|e| format!("Delete server {}: {}", path, e))?;
         done += 1;
     }
+    let mut emptied_dirs: HashSet<PathBuf> = HashSet::new();
     for path in &to_del_local {
         set_progress("delete_local", done, total_work);
-        let full = local_root.join(path.replace('/', std::path::MAIN_SEPARATOR_STR));
-        if full.exists() && full.is_file() {
-            let _ = std::fs::remove_file(&full);
-            let mut parent = full.parent();
-            while let Some(p) = parent {
-                if p != local_root && p.read_dir().map(|mut d| d.next().is_none()).unwrap_or(false) {
-                    let _ = std::fs::remove_dir(p);
-                    parent = p.parent();
-                } else {
-                    break;
-                }
+        // Only paths the listing saw as local files; the rest are already gone.
+        let full = to_local_path(local_root, path);
+        if current_local.contains(path) && std::fs::remove_file(&full).is_ok() {
+            if let Some(parent) = full.parent() {
+                emptied_dirs.insert(parent.to_path_buf());
             }
         }
         done += 1;
     }
+    remove_empty_dirs(local_root, emptied_dirs);
 
     let remaining_local: HashSet<String> = current_local.difference(&to_del_local_set).cloned().collect();
     let remaining_remote: HashSet<String> = current_remote.difference(&to_del_remote_set).cloned().collect();
-    let base_synced: HashSet<String> = remaining_local.intersection(&remaining_remote).filter(|p| !is_ignored(p)).cloned().collect();
+    let base_synced: HashSet<String> = remaining_local.intersection(&remaining_remote).cloned().collect();
 
-    let mut to_download: Vec<String> = current_remote
-        .difference(&current_local)
-        .filter(|p| !is_ignored(p))
-        .cloned()
-        .collect();
+    let mut to_download: Vec<String> = current_remote.difference(&current_local).cloned().collect();
     to_download.retain(|path| !to_del_remote_set.contains(path));
-    for (path, local_mtime) in &local_list {
-        if !is_ignored(path) && current_remote.contains(path) {
-            let remote_mtime = remote_by_path.get(path).copied().unwrap_or(0.0);
-            if remote_mtime > *local_mtime {
-                if let Some(server_hash) = remote_hashes.get(path) {
-                    let local_path = local_root.join(path.replace('/', std::path::MAIN_SEPARATOR_STR));
-                    if local_path.exists() && local_path.is_file() {
-                        if let Some(local_hash) = compute_file_hash(&local_path) {
-                            if local_hash == *server_hash {
-                                state.file_hashes.insert(path.clone(), server_hash.clone());
-                                continue;
-                            }
-                        }
-                    }
-                }
-                to_download.push(path.clone());
-            }
+
+    // One pass over the local listing: paths only on this side are uploads (except those
+    // just deleted locally); paths on both sides only need hashing when their mtimes
+    // differ, and a content match with the server hash (clock skew) means no transfer.
+    let mut to_upload: Vec<String> = Vec::new();
+    let mut changed: Vec<(&String, &LocalFile, &crate::api::FileItem, bool)> = Vec::new();
+    for (path, local) in &local_list {
+        if to_del_local_set.contains(path) {
+            continue;
+        }
+        match remote_by_item.get(path) {
+            None => to_upload.push(path.clone()),
+            Some(r) if r.mtime > local.mtime => changed.push((path, local, r, true)),
+            Some(r) if local.mtime > r.mtime => changed.push((path, local, r, false)),
+            Some(_) => {}
         }
     }
-    to_download.sort();
-    to_download.dedup();
-
-    // Build to_upload with hash-based skip when local matches server (avoids clock skew)
-    let to_upload: Vec<String> = local_list
+    // Hash the files the memo cannot answer on the worker pool first, so the comparison
+    // below is all memo lookups instead of one file read after another.
+    let stale: Vec<(&String, &LocalFile)> = changed
         .iter()
-        .filter(|(path, _)| !is_ignored(path))
-        .filter(|(path, local_mtime)| {
-            let remote = remote_by_item.get(path);
-            match remote {
-                None => true,
-                Some(r) => {
-                    if let Some(server_hash) = &r.hash {
-                        let local_path = local_root.join(path.replace('/', std::path::MAIN_SEPARATOR_STR));
-                        if local_path.exists() && local_path.is_file() {
-                            if let Some(local_hash) = compute_file_hash(&local_path) {
-                                if local_hash == *server_hash {
-                                    return false;
-                                }
-                            }
-                        }
-                    }
-                    *local_mtime > r.mtime
-                }
-            }
+        .filter(|(path, local, remote, _)| {
+            may_match_remote(local, remote) && memo_hash(&state.local_hashes, path, local).is_none()
         })
-        .map(|(path, _)| path.clone())
+        .map(|(path, local, _, _)| (*path, *local))
         .collect();
+    let _ = for_each_parallel(
+        &stale,
+        |(path, _)| Ok(compute_file_hash(&to_local_path(local_root, path))),
+        |(path, local), hash| {
+            if let Some(hash) = hash {
+                state.local_hashes.insert(path.to_string(), local.memo(hash));
+            }
+        },
+    );
+    for (path, local, remote, remote_newer) in changed {
+        let local_path = to_local_path(local_root, path);
+        if let Some(server_hash) = local_matches_remote(&mut state.local_hashes, path, &local_path, local, remote) {
+            state.file_hashes.insert(path.clone(), server_hash.to_string());
+        } else if remote_newer {
+            to_download.push(path.clone());
+        } else {
+            to_upload.push(path.clone());
+        }
+    }
+    to_download.sort();
+    to_download.dedup();
 
     log::info!(
         "Sync plan: {} to_download, {} to_upload, {} delete_server, {} delete_local",
@@ -287,63 +666,103 @@ pub fn run_sync(client: &mut ApiClient, local_root: &Path) -> Result<(u64, u64,
     let mut completed_downloads: HashSet<String> = HashSet::new();
     let mut skipped_downloads: HashSet<String> = HashSet::new();
 
+    set_progress("download", done, total_work);
+    // Presence comes from the listing taken this run, so no per-path stat is needed.
+    let mut to_fetch: Vec<&String> = Vec::with_capacity(to_download.len());
     for path in &to_download {
-        set_progress("download", done, total_work);
-        let skip = prev_downloaded.contains(path);
-        let local_path = local_root.join(path.replace('/', std::path::MAIN_SEPARATOR_STR));
-        if skip && local_path.exists() && local_path.is_file() {
+        let unchanged = prev_downloaded.contains(path)
+            || remote_hashes.get(path).is_some_and(|h| state.file_hashes.get(path.as_str()) == Some(h));
+        if unchanged && current_local.contains(path) {
             done += 1;
-            continue;
-        }
-        if let Some(ref hash) = remote_hashes.get(path) {
-            if state.file_hashes.get(path.as_str()) == Some(hash) && local_path.exists() && local_path.is_file() {
-                done += 1;
-                continue;
-            }
+        } else {
+            to_fetch.push(path);
         }
-        match client.download_file(path) {
-            Ok(body) => {
-                bytes_downloaded += body.len() as u64;
-                let _content_hash = {
-                    let mut hasher = Sha256::new();
-                    hasher.update(&body);
-                    format!("{:x}", hasher.finalize())
-                };
-                if let Some(parent) = local_path.parent() {
-                    let _ = std::fs::create_dir_all(parent);
+    }
+
+    let mut bytes_uploaded = 0u64;
+    let mut completed_uploads: HashSet<String> = HashSet::new();
+    let mut skipped_uploads: HashSet<String> = HashSet::new();
+
+    // Downloads and uploads touch disjoint paths, so both go through one worker pool:
+    // downloads are queued first and uploads start as soon as workers free up, instead
+    // of waiting for the slowest download.
+    let transfers: Vec<Transfer> = to_fetch
+        .into_iter()
+        .map(Transfer::Download)
+        .chain(to_upload.iter().map(Transfer::Upload))
+        .collect();
+
+    // Completed downloads are checkpointed into downloaded_paths (at most every
+    // STATE_CHECKPOINT_INTERVAL, and before bailing out) so an interrupted sync resumes
+    // without fetching them again; the state file is not rewritten per file.
+    let mut last_checkpoint = std::time::Instant::now();
+    let mut checkpointed = false;
+    // The first failed transfer cancels the others mid-body, so the error is reported
+    // right away instead of after every in-flight file has finished.
+    let cancel = Arc::new(AtomicBool::new(false));
+    let client = client.with_cancel_flag(Arc::clone(&cancel));
+    let client = &client;
+    let transferred = for_each_parallel(
+        &transfers,
+        |transfer| {
+            match transfer {
+                Transfer::Download(path) => {
+                    let remote_mtime = remote_by_item.get(*path).map(|r| r.mtime);
+                    download_one(client, path, remote_mtime, local_root).map(Transferred::Download)
                 }
-                let tmp_path = local_path.with_extension("tmp_download");
-                if let Err(e) = std::fs::write(&tmp_path, &body) {
-                    if e.kind() == std::io::ErrorKind::PermissionDenied {
-                        log::warn!("Download {}: permission denied, skipping", path);
-                        skipped_downloads.insert(path.clone());
-                        done += 1;
-                        continue;
+                Transfer::Upload(path) => upload_one(client, path, local_root).map(Transferred::Upload),
+            }
+            .inspect_err(|_| cancel.store(true, Ordering::Relaxed))
+        },
+        |transfer, result| {
+            let phase = match (transfer, result) {
+                (Transfer::Download(path), Transferred::Download(Fetched::Downloaded { len, hash, meta })) => {
+                    bytes_downloaded += len;
+                    completed_downloads.insert(path.to_string());
+                    // The hash streamed in with the body; only vouch for the listed server
+                    // hash when the bytes actually match it (the file may have changed on
+                    // the server since listing), so a mismatch is re-checked next sync.
+                    if let Some(h) = remote_hashes.get(*path) {
+                        if *h == hash {
+                            state.file_hashes.insert(path.to_string(), h.clone());
+                        } else {
+                            log::debug!("Download {}: content differs from listed hash", path);
+                            state.file_hashes.remove(*path);
+                        }
                     }
-                    return Err(format!("Download {}: {}", path, e));
+                    if let Some(mtime_ns) = mtime_ns(&meta) {
+                        let entry = LocalHash { hash, mtime_ns, size: meta.len(), ino: file_ino(&meta) };
+                        state.local_hashes.insert(path.to_string(), entry);
+                    }
+                    state.downloaded_paths.push(path.to_string());
+                    if last_checkpoint.elapsed() >= STATE_CHECKPOINT_INTERVAL {
+                        save_sync_state(&state, false);
+                        last_checkpoint = std::time::Instant::now();
+                        checkpointed = true;
+                    }
+                    "download"
                 }
-                if let Err(e) = std::fs::rename(&tmp_path, &local_path) {
-                    let _ = std::fs::remove_file(&tmp_path);
-                    return Err(format!("Download {}: failed to rename tmp to final: {}", path, e));
+                (Transfer::Download(path), _) => {
+                    skipped_downloads.insert(path.to_string());
+                    "download"
                 }
-                completed_downloads.insert(path.clone());
-                if let Some(h) = remote_hashes.get(path) {
-                    state.file_hashes.insert(path.clone(), h.clone());
+                (Transfer::Upload(path), Transferred::Upload(Some(len))) => {
+                    bytes_uploaded += len;
+                    completed_uploads.insert(path.to_string());
+                    "upload"
                 }
-            }
-            Err(e) => {
-                if e.contains("404") {
-                    log::debug!("Download {}: 404, file no longer on server", path);
-                    if local_path.exists() && local_path.is_file() {
-                        let _ = std::fs::remove_file(&local_path);
-                    }
-                    skipped_downloads.insert(path.clone());
-                } else {
-                    return Err(format!("Download {}: {}", path, e));
+                (Transfer::Upload(path), _) => {
+                    skipped_uploads.insert(path.to_string());
+                    "upload"
                 }
-            }
-        }
-        done += 1;
+            };
+            done += 1;
+            set_progress(phase, done, total_work);
+        },
+    );
+    if let Err(e) = transferred {
+        save_sync_state(&state, true);
+        return Err(e);
     }
 
     if !skipped_downloads.is_empty() {
@@ -359,28 +778,6 @@ pub fn run_sync(client: &mut ApiClient, local_root: &Path) -> Result<(u64, u64,
         );
     }
 
-    let mut bytes_uploaded = 0u64;
-    let mut completed_uploads: HashSet<String> = HashSet::new();
-    let mut skipped_uploads: HashSet<String> = HashSet::new();
-
-    for path in &to_upload {
-        set_progress("upload", done, total_work);
-        let full = local_root.join(path.replace('/', std::path::MAIN_SEPARATOR_STR));
-        if full.exists() && full.is_file() {
-            if let Ok(meta) = std::fs::metadata(&full) {
-                bytes_uploaded += meta.len();
-            }
-            if let Err(e) = client.upload_file_from_path(path, &full) {
-                return Err(format!("Upload {}: {}", path, e));
-            }
-            completed_uploads.insert(path.clone());
-        } else {
-            log::debug!("Upload {}: file no longer present, skipping", path);
-            skipped_uploads.insert(path.clone());
-        }
-        done += 1;
-    }
-
     let mut warning_msg = None;
     let mut warnings: Vec<String> = Vec::new();
     if !skipped_downloads.is_empty() {
@@ -417,9 +814,14 @@ pub fn run_sync(client: &mut ApiClient, local_root: &Path) -> Result<(u64, u64,
         .collect();
     let mut new_synced: Vec<String> = new_synced.into_iter().collect();
     new_synced.sort();
+    // Every source set derives from the pre-filtered listings; no ignored path gets here.
+    debug_assert!(!new_synced.iter().any(|p| is_ignored(p)));
+    state.local_hashes.retain(|p, _| new_synced.binary_search(p).is_ok());
     state.paths = new_synced;
     state.downloaded_paths.clear();
-    save_sync_state(&state);
+    if checkpointed || state != loaded_state {
+        save_sync_state(&state, true);
+    }
 
     set_progress("idle", 0, 0);
 
@@ -442,6 +844,70 @@ pub fn run_sync(client: &mut ApiClient, local_root: &Path) -> Result<(u64, u64,
 mod tests {
     use super::*;
     use std::collections::HashSet;
+    use std::io::{Read, Write};
+
+    /// Minimal HTTP server answering GET /api/files/download?path=<p> with `files[p]`,
+    /// sent in small slices so concurrent downloads overlap. Returns its base URL.
+    fn serve_downloads(files: HashMap<String, Vec<u8>>) -> String {
+        let listener = std::net::TcpListener::bind("127.0.0.1:0").unwrap();
+        let base = format!("http://{}", listener.local_addr().unwrap());
+        let files = Arc::new(files);
+        std::thread::spawn(move || {
+            for mut conn in listener.incoming().flatten() {
+                let files = Arc::clone(&files);
+                std::thread::spawn(move || {
+                    let mut request = Vec::new();
+                    let mut buf = [0u8; 1024];
+                    while !request.ends_with(b"\r\n\r\n") {
+                        match conn.read(&mut buf) {
+                            Ok(0) | Err(_) => return,
+                            Ok(n) => request.extend_from_slice(&buf[..n]),
+                        }
+                    }
+                    let request = String::from_utf8_lossy(&request);
+                    let target = request.split_whitespace().nth(1).unwrap_or("");
+                    let path = target.split_once("path=").map_or("", |(_, p)| p);
+                    let path = urlencoding::decode(path).unwrap().into_owned();
+                    let Some(body) = files.get(&path) else {
+                        let _ = conn.write_all(b"HTTP/1.1 404 Not Found\r\nContent-Length: 0\r\nConnection: close\r\n\r\n");
+                        return;
+                    };
+                    let head = format!("HTTP/1.1 200 OK\r\nContent-Length: {}\r\nConnection: close\r\n\r\n", body.len());
+                    let _ = conn.write_all(head.as_bytes());
+                    for slice in body.chunks(4096) {
+                        let _ = conn.write_all(slice);
+                        std::thread::sleep(std::time::Duration::from_millis(1));
+                    }
+                });
+            }
+        });
+        base
+    }
+
+    /// Same-stem files downloading at once must not share a temp file.
+    #[test]
+    fn parallel_downloads_of_same_stem_files_keep_their_own_content() {
+        let root = std::env::temp_dir().join(format!("bb_sync_test_{}", uuid::Uuid::new_v4()));
+        std::fs::create_dir_all(&root).unwrap();
+        let paths = ["report.pdf", "report.docx", "a.tar.gz", "a.tar.bz2"];
+        let files: HashMap<String, Vec<u8>> =
+            paths.iter().map(|p| (p.to_string(), p.as_bytes().repeat(20_000))).collect();
+        let client = ApiClient::new(serve_downloads(files.clone()));
+
+        let mut fetched = Vec::new();
+        for_each_parallel(&paths, |p| download_one(&client, p, None, &root), |p, f| fetched.push((*p, f))).unwrap();
+        assert_eq!(fetched.len(), paths.len());
+        for (path, f) in fetched {
+            let Fetched::Downloaded { hash, .. } = f else { panic!("{} skipped", path) };
+            let on_disk = std::fs::read(root.join(path)).unwrap();
+            assert_eq!(on_disk, files[path], "{}", path);
+            assert_eq!(hash, format!("{:x}", Sha256::digest(&on_disk)));
+        }
+        let leftovers = std::fs::read_dir(&root).unwrap().count();
+        assert_eq!(leftovers, paths.len());
+
+        let _ = std::fs::remove_dir_all(&root);
+    }
 
     /// Scenario: user had file (in last_synced), deletes it locally; sync must delete from server, not re-download.
     #[test]
@@ -472,4 +938,154 @@ mod tests {
             "file deleted locally must not be in to_download (must not be re-downloaded)"
         );
     }
+
+    /// Every job runs once on success; a failing job surfaces its error and stops the rest.
+    #[test]
+    fn for_each_parallel_reports_results_and_first_error() {
+        let items: Vec<u32> = (0..100).collect();
+        let mut seen = Vec::new();
+        assert!(for_each_parallel(&items, |&i| Ok(i * 2), |_, r| seen.push(r)).is_ok());
+        seen.sort();
+        assert_eq!(seen, items.iter().map(|i| i * 2).collect::<Vec<_>>());
+
+        let res = for_each_parallel(&items, |&i| if i == 3 { Err("boom".to_string()) } else { Ok(()) }, |_, _| {});
+        assert_eq!(res, Err("boom".to_string()));
+
+        // A job cancelled because of the failure finishes first but must not mask it.
+        let both_started = std::sync::Barrier::new(2);
+        let res = for_each_parallel(
+            &[0u32, 1],
+            |&i| {
+                both_started.wait();
+                if i == 0 {
+                    Err(crate::api::CANCELLED.to_string())
+                } else {
+                    std::thread::sleep(std::time::Duration::from_millis(20));
+                    Err("boom".to_string())
+                }
+            },
+            |_, _: ()| {},
+        );
+        assert_eq!(res, Err("boom".to_string()));
+    }
+
+    #[test]
+    fn is_ignored_matches_git_dirs_and_ignored_names() {
+        assert!(is_ignored(".git/HEAD"));
+        assert!(is_ignored("src/.git/config"));
+        assert!(is_ignored("src\\.git\\config"));
+        assert!(is_ignored("photos/Thumbs.db"));
+        assert!(is_ignored(".DS_Store"));
+        assert!(!is_ignored(".git"));
+        assert!(!is_ignored("src/.gitignore"));
+        assert!(!is_ignored("notes/Thumbs.db.txt"));
+    }
+
+    /// Emptied directories are removed up to, but never including, the sync root.
+    #[test]
+    fn remove_empty_dirs_climbs_to_root_and_keeps_non_empty() {
+        let root = std::env::temp_dir().join(format!("bb_sync_test_{}", uuid::Uuid::new_v4()));
+        std::fs::create_dir_all(root.join("a/b/c")).unwrap();
+        std::fs::create_dir_all(root.join("a/d")).unwrap();
+        std::fs::create_dir_all(root.join("x/y")).unwrap();
+        std::fs::write(root.join("a/d/keep.txt"), b"k").unwrap();
+
+        let dirs: HashSet<PathBuf> = [root.join("a/b/c"), root.join("x/y")].into_iter().collect();
+        remove_empty_dirs(&root, dirs);
+
+        assert!(!root.join("a/b").exists());
+        assert!(root.join("a/d/keep.txt").exists());
+        assert!(!root.join("x").exists());
+        assert!(root.exists());
+
+        let _ = std::fs::remove_dir_all(&root);
+    }
+
+    /// A .git directory at any depth is skipped as a whole; a plain file named .git is not.
+    #[test]
+    fn list_local_skips_git_directories() {
+        let dir = std::env::temp_dir().join(format!("bb_sync_test_{}", uuid::Uuid::new_v4()));
+        std::fs::create_dir_all(dir.join(".git")).unwrap();
+        std::fs::create_dir_all(dir.join("sub/.git/objects")).unwrap();
+        std::fs::write(dir.join(".git/HEAD"), b"ref").unwrap();
+        std::fs::write(dir.join("sub/.git/objects/x"), b"obj").unwrap();
+        std::fs::write(dir.join("sub/.git_keep"), b"keep").unwrap();
+        std::fs::write(dir.join("a.txt"), b"a").unwrap();
+
+        let mut paths: Vec<String> = list_local(&dir).into_iter().map(|(p, _)| p).collect();
+        paths.sort();
+        assert_eq!(paths, vec!["a.txt".to_string(), "sub/.git_keep".to_string()]);
+
+        let _ = std::fs::remove_dir_all(&dir);
+    }
+
+    /// Size mismatch against the listed remote size must rule out a match; equal content must match.
+    #[test]
+    fn local_matches_remote_uses_size_then_hash() {
+        let dir = std::env::temp_dir().join(format!("bb_sync_test_{}", uuid::Uuid::new_v4()));
+        std::fs::create_dir_all(&dir).unwrap();
+        let file = dir.join("a.txt");
+        std::fs::write(&file, b"hello").unwrap();
+        let hash = compute_file_hash(&file).unwrap();
+
+        let mut hashes = HashMap::new();
+        let local = LocalFile { mtime: 0.0, mtime_ns: 1, size: 5, ino: 0 };
+
+        let same = crate::api::FileItem { path: "a.txt".into(), mtime: 0.0, size: Some(5), hash: Some(hash.clone()) };
+        assert_eq!(local_matches_remote(&mut hashes, "a.txt", &file, &local, &same), Some(hash.as_str()));
+
+        let other_size = crate::api::FileItem { path: "a.txt".into(), mtime: 0.0, size: Some(6), hash: Some(hash.clone()) };
+        assert_eq!(local_matches_remote(&mut hashes, "a.txt", &file, &local, &other_size), None);
+
+        let no_hash = crate::api::FileItem { path: "a.txt".into(), mtime: 0.0, size: Some(5), hash: None };
+        assert_eq!(local_matches_remote(&mut hashes, "a.txt", &file, &local, &no_hash), None);
+
+        let _ = std::fs::remove_dir_all(&dir);
+    }
+
+    #[test]
+    fn progress_events_are_throttled_except_at_phase_end() {
+        let mut last = None;
+        assert!(progress_event_due(&mut last, "download", 1, 100));
+        assert!(!progress_event_due(&mut last, "download", 2, 100));
+        assert!(progress_event_due(&mut last, "download", 100, 100));
+        assert!(progress_event_due(&mut last, "idle", 0, 0));
+        std::thread::sleep(PROGRESS_EMIT_INTERVAL);
+        assert!(progress_event_due(&mut last, "download", 3, 100));
+    }
+
+    #[test]
+    fn progress_event_for_a_new_phase_is_never_throttled() {
+        let mut last = None;
+        assert!(progress_event_due(&mut last, "delete_server", 0, 100));
+        assert!(progress_event_due(&mut last, "delete_local", 1, 100));
+        assert!(progress_event_due(&mut last, "download", 2, 100));
+        assert!(!progress_event_due(&mut last, "download", 3, 100));
+        assert!(progress_event_due(&mut last, "upload", 4, 100));
+        assert!(progress_event_due(&mut last, "idle", 0, 0));
+    }
+
+    /// An unchanged (mtime, size, inode) must reuse the stored hash; any change must rehash.
+    #[test]
+    fn cached_file_hash_rehashes_only_when_stat_changes() {
+        let dir = std::env::temp_dir().join(format!("bb_sync_test_{}", uuid::Uuid::new_v4()));
+        std::fs::create_dir_all(&dir).unwrap();
+        let file = dir.join("a.txt");
+        std::fs::write(&file, b"hello").unwrap();
+        let mut hashes = HashMap::new();
+        let local = LocalFile { mtime: 0.0, mtime_ns: 7, size: 5, ino: 3 };
+        hashes.insert("a.txt".to_string(), local.memo("cached".into()));
+        assert_eq!(cached_file_hash(&mut hashes, "a.txt", &file, &local).as_deref(), Some("cached"));
+
+        let replaced = LocalFile { ino: 4, ..local };
+        assert_ne!(cached_file_hash(&mut hashes, "a.txt", &file, &replaced).as_deref(), Some("cached"));
+
+        let touched = LocalFile { mtime: 0.0, mtime_ns: 8, size: 5, ino: 4 };
+        let fresh = compute_file_hash(&file).unwrap();
+        assert_eq!(cached_file_hash(&mut hashes, "a.txt", &file, &touched), Some(fresh.clone()));
+        assert_eq!(hashes["a.txt"].hash, fresh);
+        assert_eq!(hashes["a.txt"].mtime_ns, 8);
+
+        let _ = std::fs::remove_dir_all(&dir);
+    }
 }
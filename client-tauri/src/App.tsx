@@ -1,4 +1,4 @@
-import { useState, useEffect, useCallback, useRef } from "react";
+import { useState, useEffect, useCallback, useRef, lazy, Suspense } from "react";
 import { invoke } from "@tauri-apps/api/core";
 import { getCurrentWindow } from "@tauri-apps/api/window";
 import { defaultWindowIcon } from "@tauri-apps/api/app";
@@ -8,10 +8,13 @@ import { isPermissionGranted, requestPermission, sendNotification } from "@tauri
 import { TrayIcon } from "@tauri-apps/api/tray";
 import { Menu } from "@tauri-apps/api/menu";
 import { Box, ThemeProvider, createTheme, CssBaseline } from "@mui/material";
-import Login from "./Login";
-import Settings from "./Settings";
 import TitleBar from "./TitleBar";
 
+// Only one of these views is shown per session state; load each chunk on first use
+// so tray start-up does not parse the settings UI (and its icon set) up front.
+const Login = lazy(() => import("./Login"));
+const Settings = lazy(() => import("./Settings"));
+
 type SyncStatus = "idle" | "syncing" | "synced" | "warning" | "error";
 
 interface SyncStatusPayload {
@@ -21,6 +24,9 @@ interface SyncStatusPayload {
 
 const SYNC_NOTIFY_THRESHOLD_BYTES = 5 * 1024 * 1024; // 5 MB
 
+/** Fallback, synced, syncing and error icons, in that order. */
+const TRAY_ICON_FILES = ["32x32.png", "icon_synced.png", "icon_syncing.png", "icon_error.png"];
+
 interface SyncCompletedPayload {
   bytesDownloaded: number;
   bytesUploaded: number;
@@ -164,14 +170,15 @@ export default function App() {
           ],
         });
         if (cancelled) return;
-        const fallback = await resolveResource("icons/32x32.png").catch(() => null);
+        // Resolve all tray icon paths in one round of IPC calls instead of one after another.
+        const [fallback, synced, syncing, error] = await Promise.all(
+          TRAY_ICON_FILES.map((name) => resolveResource(`icons/${name}`).catch(() => null))
+        );
+        if (cancelled) return;
         const defaultIcon = fallback ?? (await defaultWindowIcon().catch(() => null)) ?? undefined;
-        const blue =
-          (await resolveResource("icons/icon_synced.png").catch(() => null)) ?? fallback ?? "";
-        const yellow =
-          (await resolveResource("icons/icon_syncing.png").catch(() => null)) ?? fallback ?? "";
-        const red =
-          (await resolveResource("icons/icon_error.png").catch(() => null)) ?? fallback ?? "";
+        const blue = synced ?? fallback ?? "";
+        const yellow = syncing ?? fallback ?? "";
+        const red = error ?? fallback ?? "";
         stateIconsRef.current = { blue, yellow, red };
         const trayIcon = await TrayIcon.new({
           icon: blue || defaultIcon,
@@ -286,11 +293,13 @@ export default function App() {
       <Box sx={{ display: "flex", flexDirection: "column", height: "100vh", overflow: "hidden" }}>
         <TitleBar />
         <Box sx={{ flex: 1, overflow: "auto" }}>
-          {view === "login" ? (
-            <Login onSuccess={handleLoginSuccess} onCancel={undefined} />
-          ) : (
-            <Settings email={email} onLogout={handleLogout} />
-          )}
+          <Suspense fallback={null}>
+            {view === "login" ? (
+              <Login onSuccess={handleLoginSuccess} onCancel={undefined} />
+            ) : (
+              <Settings email={email} onLogout={handleLogout} />
+            )}
+          </Suspense>
         </Box>
       </Box>
     </ThemeProvider>
@@ -42,6 +42,9 @@ function formatBytes(n: number): string {
   return `${n} B`;
 }
 
+const PROGRESS_POLL_MIN_MS = 1000;
+const PROGRESS_POLL_MAX_MS = 8000;
+
 interface SettingsProps {
   email: string | null;
   onLogout: () => void;
@@ -172,15 +175,43 @@ export default function Settings({ email, onLogout }: SettingsProps) {
 
   useEffect(() => {
     if (!syncing) return;
-    const interval = setInterval(async () => {
+    const unlistenPromise = listen<{ phase: string; current: number; total: number }>("sync-progress", (event) => {
+      setSyncProgress(event.payload);
+    });
+    return () => {
+      unlistenPromise.then((fn) => fn());
+    };
+  }, [syncing]);
+
+  useEffect(() => {
+    if (!syncing) return;
+    // Safety net for updates missed before the listener attached; sync-progress events
+    // carry the live updates. Back off while progress is unchanged.
+    let delay = PROGRESS_POLL_MIN_MS;
+    let lastKey = "";
+    let cancelled = false;
+    let timer: ReturnType<typeof setTimeout>;
+    const poll = async () => {
       try {
         const p = await invoke<{ phase: string; current: number; total: number } | null>("get_sync_progress");
-        if (p) setSyncProgress(p);
+        const key = p ? `${p.phase}:${p.current}:${p.total}` : "";
+        if (key !== lastKey) {
+          lastKey = key;
+          delay = PROGRESS_POLL_MIN_MS;
+          if (p) setSyncProgress(p);
+        } else {
+          delay = Math.min(delay * 2, PROGRESS_POLL_MAX_MS);
+        }
       } catch {
         // ignore
       }
-    }, 500);
-    return () => clearInterval(interval);
+      if (!cancelled) timer = setTimeout(poll, delay);
+    };
+    timer = setTimeout(poll, delay);
+    return () => {
+      cancelled = true;
+      clearTimeout(timer);
+    };
   }, [syncing]);
 
   const handleAutostart = async (_: unknown, checked: boolean) => {